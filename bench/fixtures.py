@@ -0,0 +1,105 @@
+"""
+Synthetic fixtures the size of a large Elm project: source modules that
+import each other, the elm-oracle output for them, installed package
+documentation, and docs.json modules.
+"""
+import json
+import os
+import os.path as fs
+import random
+
+SYLLABLES = ['map', 'fold', 'filter', 'get', 'set', 'to', 'from', 'with', 'update', 'view',
+    'list', 'dict', 'int', 'string', 'first', 'last', 'sort', 'by', 'and', 'then', 'try']
+TYPES = ['a', 'b', 'Int', 'String', 'Bool', 'List a', 'Maybe b', 'Dict comparable v', '(a -> b)', '( a, b )']
+COMMENT = (' {0} the given values.\n\n    {1} f xs == xs\n        |> List.map f\n\n'
+    'Returns the {1} of the list.\n')
+
+def identifier(rng, capital=False):
+    word = ''.join(rng.choice(SYLLABLES).capitalize() for _ in range(rng.randint(1, 3)))
+    return word if capital else word[0].lower() + word[1:]
+
+def signature(rng):
+    return ' -> '.join(rng.choice(TYPES) for _ in range(rng.randint(1, 5)))
+
+def package_modules(rng, count):
+    names = set()
+    while len(names) < count:
+        names.add('.'.join(identifier(rng, True) for _ in range(rng.randint(1, 3))))
+    return sorted(names)
+
+def oracle_entries(rng, modules, count):
+    entries = []
+    for i in range(count):
+        module = modules[i % len(modules)]
+        name = identifier(rng)
+        entries.append({
+            'name': name,
+            'fullName': module + '.' + name,
+            'href': 'http://package.elm-lang.org/packages/bench/pkg/1.0.0/' + module.replace('.', '-') + '#' + name,
+            'signature': signature(rng),
+            'comment': COMMENT.format(name.capitalize(), name),
+        })
+    return entries
+
+def docs_modules(rng, modules, values_per_module):
+    docs = []
+    for module in modules:
+        datatypes = [identifier(rng, True) for _ in range(3)]
+        docs.append({
+            'name': module,
+            'values': [{'raw': identifier(rng) + ' : ' + signature(rng)} for _ in range(values_per_module)],
+            'datatypes': [{'name': datatype, 'constructors': [{'name': datatype + identifier(rng, True)}]}
+                for datatype in datatypes],
+            'aliases': [{'name': identifier(rng, True)}],
+        })
+    return docs
+
+def write_package_docs(root, entries):
+    """
+    Install the modules of oracle `entries` under `root`/elm-stuff, the way
+    elm-package leaves a dependency's documentation.json.
+    """
+    package, version = 'bench/pkg', '1.0.0'
+    modules = {}
+    for entry in entries:
+        module = entry['fullName'].rpartition('.')[0]
+        modules.setdefault(module, []).append(
+            {'name': entry['name'], 'type': entry['signature'], 'comment': entry['comment']})
+    docs = [{'name': name, 'comment': '', 'aliases': [], 'types': [], 'values': values}
+        for name, values in sorted(modules.items())]
+    package_dir = fs.join(root, 'elm-stuff', 'packages', package, version)
+    if not fs.isdir(package_dir):
+        os.makedirs(package_dir)
+    with open(fs.join(package_dir, 'documentation.json'), 'w') as docs_file:
+        json.dump(docs, docs_file)
+    with open(fs.join(root, 'elm-stuff', 'exact-dependencies.json'), 'w') as json_file:
+        json.dump({package: version}, json_file)
+
+def make_project(root, modules=500, entries=20000, seed=1):
+    """
+    Write a project of `modules` Elm files under `root` and the oracle
+    output for it with `entries` entries. Returns the paths written.
+    """
+    rng = random.Random(seed)
+    packages = package_modules(rng, max(entries // 100, 1))
+    with open(fs.join(root, 'elm-package.json'), 'w') as json_file:
+        json.dump({'version': '1.0.0', 'source-directories': ['src'],
+            'dependencies': {'elm-lang/core': '4.0.0 <= v < 5.0.0'}}, json_file, indent=4)
+    elm_files = []
+    names = ['App.Page{0}.Module{1}'.format(i % 25, i) for i in range(modules)]
+    for i, name in enumerate(names):
+        file_path = fs.join(root, 'src', *name.split('.')) + '.elm'
+        if not fs.isdir(fs.dirname(file_path)):
+            os.makedirs(fs.dirname(file_path))
+        imports = ['import {0}'.format(names[j]) for j in range(max(i - 3, 0), i)]
+        imports += ['import {0} as P{1} exposing (..)'.format(rng.choice(packages), k) for k in range(3)]
+        # every 50th module is an entry point
+        main = '\n\nmain =\n    value{0}\n'.format(i) if i % 50 == 49 else ''
+        with open(file_path, 'w') as elm_file:
+            elm_file.write('module {0} exposing (..)\n\n{1}\n\n\nvalue{2} : Int\nvalue{2} =\n    {2}\n{3}'.format(
+                name, '\n'.join(imports), i, main))
+        elm_files.append(file_path)
+    oracle_path = fs.join(root, 'oracle.json')
+    with open(oracle_path, 'w') as oracle_file:
+        json.dump(oracle_entries(rng, packages, entries), oracle_file)
+    return {'root': root, 'elm_files': elm_files, 'oracle': oracle_path, 'packages': packages}
@@ -0,0 +1,172 @@
+module Main (main, Model, Action(..), update, view) where
+
+{-| A counter list, written to exercise most of the Elm grammar.
+
+    import Main exposing (main)
+
+@docs main, Model, Action, update, view
+-}
+
+import Dict as D exposing (Dict)
+import Html exposing (Html, div, button, text, span)
+import Html.Attributes exposing (class, style)
+import Html.Events exposing (onClick)
+import Signal exposing (Address)
+import String
+import Task exposing (Task, andThen)
+import Graphics.Element exposing (show)
+import Math.Vector3 exposing (..)
+import WebGL exposing (..)
+
+
+-- MODEL
+
+
+type alias Model =
+    { counters : Dict Int Counter
+    , nextId : Int
+    , title : String
+    }
+
+
+type alias Counter =
+    { count : Int, label : String, step : Float }
+
+
+type Action
+    = Insert String
+    | Remove Int
+    | Modify Int CounterAction
+    | NoOp
+
+
+type CounterAction
+    = Increment
+    | Decrement
+    | Reset
+
+
+init : Model
+init =
+    { counters = D.empty
+    , nextId = 0
+    , title = "Counters \"with\" escapes \t and \x41 unicode \u{1F600}"
+    }
+
+
+{- a block comment {- with a nested block -} and `backticks` -}
+infixl 4 <+>
+(<+>) : Int -> Int -> Int
+(<+>) a b =
+    a + b * 2 - (a // b) `rem` 3
+
+
+-- UPDATE
+
+
+update : Action -> Model -> Model
+update action model =
+    case action of
+        Insert label ->
+            { model
+                | counters = D.insert model.nextId (Counter 0 label 1.5e-3) model.counters
+                , nextId = model.nextId + 1
+            }
+
+        Remove id ->
+            { model | counters = D.remove id model.counters }
+
+        Modify id counterAction ->
+            let
+                modify counter =
+                    case counterAction of
+                        Increment ->
+                            { counter | count = counter.count + 1 }
+
+                        Decrement ->
+                            { counter | count = counter.count - 1 }
+
+                        Reset ->
+                            { counter | count = 0 }
+            in
+                { model | counters = D.update id (Maybe.map modify) model.counters }
+
+        NoOp ->
+            model
+
+
+-- VIEW
+
+
+view : Address Action -> Model -> Html
+view address model =
+    let
+        counters =
+            D.toList model.counters
+                |> List.map (\( id, counter ) -> viewCounter address id counter)
+
+        header =
+            div [ class "header", style [ ( "color", "#333" ), ( "margin", "0 auto" ) ] ]
+                [ text model.title
+                , button [ onClick address (Insert "new") ] [ text "+" ]
+                ]
+    in
+        div [] (header :: counters)
+
+
+viewCounter : Address Action -> Int -> Counter -> Html
+viewCounter address id { count, label } =
+    div [ class 'c' |> always "counter" ]
+        [ span [] [ text (label ++ ": " ++ toString count) ]
+        , button [ onClick address (Modify id Decrement) ] [ text "-" ]
+        , button [ onClick address (Modify id Increment) ] [ text "+" ]
+        , button [ onClick address (Remove id) ] [ text "x" ]
+        ]
+
+
+chars : List Char
+chars =
+    [ 'a', '\n', '\'', '\x7F', ' ' ]
+
+
+numbers : List Float
+numbers =
+    [ 0, 42, 3.14, 1e10, 0x1F |> toFloat, -7 ]
+
+
+multiline : String
+multiline = """
+A triple quoted string
+with "quotes" inside
+"""
+
+
+vertexShader : Shader { attr | position : Vec3 } {} { vcolor : Vec3 }
+vertexShader = [glsl|
+attribute vec3 position;
+varying vec3 vcolor;
+void main () {
+    gl_Position = vec4(position, 1.0);
+    vcolor = vec3(1.0, 0.5, 0.0);
+}
+|]
+
+
+port requests : Signal (Task x ())
+port requests =
+    Signal.map (\_ -> Task.succeed ()) (Signal.constant ())
+
+
+main : Signal Html
+main =
+    Signal.map (view actions.address) model
+
+
+model : Signal Model
+model =
+    Signal.foldp update init actions.signal
+
+
+actions : Signal.Mailbox Action
+actions =
+    Signal.mailbox NoOp
@@ -0,0 +1,257 @@
+"""
+Headless tokenization benchmark for the package's grammars, and a detector
+for patterns that backtrack catastrophically.
+
+Tokenizes an Elm corpus with `Elm`, compile messages rendered from the
+recorded elm-make report with `Elm Compile Messages`, and documentation
+built from the corpus with `Elm Documentation`. Prints the time spent per
+pattern and the slowest lines, then pumps every pattern with repeated input
+to find the ones whose search time grows faster than the input.
+
+Exits non-zero when a budget is exceeded or a pattern is flagged as
+catastrophic, or with --strict, as superlinear.
+
+Usage: python bench/grammar.py [--repeat N] [--budget-ms-per-kb MS] [--budget-line-ms MS]
+                               [--strict] [--no-detect] [--json PATH] [file or dir ...]
+"""
+import argparse
+import json
+import math
+import os
+import os.path as fs
+import re
+import string
+import sys
+import time
+
+import tmgrammar
+
+HERE = fs.dirname(fs.abspath(__file__))
+CORPUS = fs.join(HERE, 'fixtures', 'corpus')
+MAKE_REPORT = fs.join(HERE, 'fixtures', 'elm-make-report.txt')
+ERROR_FORMAT = string.Template('==== $type in $file:$line:$column: ====\n$message\n----')
+INFO_FORMAT = string.Template('=== $info ===')
+ZERO_WIDTH_SPACE = u'\ufeff'
+
+# repeated to make the input a pattern is pumped with
+PUMP_UNITS = [' ', 'a', 'a ', 'A.', '1', '-', '=', '`a', '"a', "'a", '\\', '{-', '(', '( ', '[', ',', '|', ':', '.', '==== ']
+PUMP_LIMIT = 0.05
+GROWTH_LIMIT = 1.5
+
+def elm_corpus(paths):
+    files = []
+    for path in paths:
+        if fs.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames[:] = [name for name in dirnames if name != 'elm-stuff']
+                files.extend(fs.join(dirpath, name) for name in sorted(filenames) if name.endswith('.elm'))
+        else:
+            files.append(path)
+    texts = []
+    for file_path in files:
+        with open(file_path, encoding='utf-8') as elm_file:
+            texts.append((fs.relpath(file_path), elm_file.read()))
+    return texts
+
+def compile_messages():
+    """
+    Render the recorded elm-make report the way the build system does.
+    """
+    messages = []
+    with open(MAKE_REPORT, encoding='utf-8') as report:
+        for line in report:
+            line = line.strip()
+            if not line.startswith('['):
+                messages.append(INFO_FORMAT.substitute(info=line))
+                continue
+            for error in json.loads(line):
+                message = error['overview'] + ('\n' + error['details'] if error['details'] else '')
+                messages.append(ERROR_FORMAT.substitute(type=error['type'], file=error['file'],
+                    line=error['region']['start']['line'], column=error['region']['start']['column'],
+                    message=message))
+    return '\n'.join(messages) + '\n'
+
+def documentation(texts):
+    """
+    Turn the doc comments of the corpus into panel text, with code examples
+    delimited by zero width spaces as in the show type panel.
+    """
+    blocks = []
+    for name, text in texts:
+        for comment in re.findall(r'\{-\|(.*?)-\}', text, re.DOTALL):
+            blocks.append(comment.strip())
+        blocks.append(ZERO_WIDTH_SPACE + '\n' + text[:2000] + '\n' + ZERO_WIDTH_SPACE)
+    return '\n\n'.join(blocks) + '\n'
+
+def tokenize_timed(grammar, text):
+    """
+    Tokenize `text` and return the time taken by each line in seconds.
+    """
+    tokenizer = tmgrammar.Tokenizer(grammar)
+    timings = []
+    for number, line in enumerate(text.splitlines(True), 1):
+        start = time.perf_counter()
+        tokenizer.tokenize_line(line if line.endswith('\n') else line + '\n')
+        timings.append((time.perf_counter() - start, number, line.rstrip('\n')))
+    return timings
+
+def benchmark(grammar, name, text, repeat):
+    grammar.reset_timings()
+    best = None
+    for _ in range(repeat):
+        timings = tokenize_timed(grammar, text)
+        total = sum(seconds for seconds, number, line in timings)
+        if best is None or total < best[0]:
+            best = (total, timings)
+    total, timings = best
+    size = len(text.encode('utf-8')) / 1024.0
+    patterns = sorted(grammar.patterns(), key=lambda pattern: -pattern.seconds)
+    return {
+        'grammar': grammar.name,
+        'corpus': name,
+        'lines': len(timings),
+        'kb': size,
+        'ms': total * 1000,
+        'ms_per_kb': total * 1000 / size if size else 0,
+        'slowest_lines': [{'line': number, 'ms': seconds * 1000, 'text': line[:60]}
+            for seconds, number, line in sorted(timings, reverse=True)[:5]],
+        'patterns': [{'pattern': pattern.label, 'calls': pattern.calls // repeat,
+            'ms': pattern.seconds * 1000 / repeat} for pattern in patterns if pattern.calls][:10],
+    }
+
+def nested_quantifiers(source):
+    """
+    Return True if a group containing an unbounded quantifier is itself
+    repeated without bound, as in `(a+)*`, the usual shape of a pattern that
+    backtracks exponentially.
+    """
+    groups = [False]
+    i = 0
+    in_class = False
+    while i < len(source):
+        char = source[i]
+        if char == '\\':
+            i += 2
+            continue
+        if in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+            if source[i + 1:i + 2] == ']':
+                i += 1
+        elif char == '(':
+            groups.append(False)
+        elif char == ')' and len(groups) > 1:
+            inner = groups.pop()
+            if inner and unbounded(source, i + 1):
+                return True
+            groups[-1] = groups[-1] or inner
+        elif unbounded(source, i):
+            groups[-1] = True
+        i += 1
+    return False
+
+def unbounded(source, i):
+    return source[i:i + 1] in ('*', '+') or bool(re.match(r'\{\d*,\}', source[i:]))
+
+def search_time(regex, text):
+    start = time.perf_counter()
+    regex.search(text)
+    return time.perf_counter() - start
+
+def growth(regex, unit):
+    """
+    Search `regex` in `unit` repeated more and more times, and return the
+    growth exponent of the search time along with the longest time seen. An
+    exponent near 1 is linear; anything much larger will hang on long lines.
+    """
+    samples = []
+    for length in (8, 12, 16, 20, 24, 32, 64, 128, 256, 512, 1024, 2048):
+        seconds = min(search_time(regex, unit * length + '\n') for _ in range(3))
+        samples.append((length, seconds))
+        if seconds > PUMP_LIMIT:
+            break
+    (short, short_time), (long, long_time) = samples[-2], samples[-1]
+    if long_time < 1e-4:
+        return 1.0, long_time
+    exponent = math.log(long_time / max(short_time, 1e-7)) / math.log(float(long) / short)
+    return exponent, long_time
+
+def detect(registry):
+    """
+    Return the patterns whose search time grows faster than linearly with
+    the input. Growth beyond cubic, or the shape of nested quantifiers, is
+    reported as catastrophic; anything else above GROWTH_LIMIT as superlinear.
+    """
+    flagged = []
+    for grammar in registry.values():
+        for pattern in grammar.patterns():
+            # end patterns with back references are pumped with a typical delimiter
+            regex = pattern.regex or tmgrammar.compile_regex(
+                tmgrammar.BACKREF_RE.sub('===', pattern.source))
+            nested = nested_quantifiers(pattern.source)
+            worst = max((growth(regex, unit) + (unit,) for unit in PUMP_UNITS))
+            exponent, seconds, unit = worst
+            if not nested and (exponent <= GROWTH_LIMIT or seconds < 1e-3):
+                continue
+            flagged.append({'grammar': grammar.name, 'pattern': pattern.label, 'source': pattern.source,
+                'severity': 'catastrophic' if nested or exponent > 3 else 'superlinear',
+                'reason': ('nested unbounded quantifiers, ' if nested else '') +
+                    'search time grows as n^{0:.1f} on {1!r} * n ({2:.1f} ms)'.format(exponent, unit, seconds * 1000)})
+    return flagged
+
+def print_result(result):
+    print('{grammar} on {corpus}: {lines} lines, {kb:.1f} KB in {ms:.1f} ms ({ms_per_kb:.2f} ms/KB)'.format(**result))
+    print('  patterns by time:')
+    for pattern in result['patterns']:
+        print('    {ms:8.2f} ms {calls:7} calls  {pattern}'.format(**pattern))
+    print('  slowest lines:')
+    for line in result['slowest_lines']:
+        print('    {ms:8.3f} ms  {line:5}: {text}'.format(**line))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('paths', nargs='*', help='Elm files or directories, defaults to the bundled corpus')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget-ms-per-kb', type=float, default=10.0)
+    parser.add_argument('--budget-line-ms', type=float, default=5.0)
+    parser.add_argument('--no-detect', action='store_true', help='skip the backtracking detector')
+    parser.add_argument('--strict', action='store_true', help='fail on superlinear patterns too')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    registry = tmgrammar.Registry().load_package()
+    texts = elm_corpus(args.paths or [CORPUS])
+    corpora = [(registry['source.elm'], name, text) for name, text in texts]
+    corpora.append((registry['text.html.mediawiki.elm-build-output'], 'elm-make report', compile_messages()))
+    corpora.append((registry['text.html.mediawiki.elm-documentation'], 'doc comments', documentation(texts)))
+
+    failures = []
+    results = []
+    for grammar, name, text in corpora:
+        result = benchmark(grammar, name, text, args.repeat)
+        results.append(result)
+        print_result(result)
+        if result['ms_per_kb'] > args.budget_ms_per_kb:
+            failures.append('{grammar} on {corpus}: {ms_per_kb:.2f} ms/KB'.format(**result))
+        for line in result['slowest_lines']:
+            if line['ms'] > args.budget_line_ms:
+                failures.append('{0} on {1}: line {2} took {3:.2f} ms'.format(
+                    result['grammar'], result['corpus'], line['line'], line['ms']))
+
+    flagged = [] if args.no_detect else detect(registry)
+    print('backtracking detector: {0} pattern(s) flagged'.format(len(flagged)))
+    for pattern in flagged:
+        print('  {severity}: {grammar}: {pattern}\n    {source!r}\n    {reason}'.format(**pattern))
+        if args.strict or pattern['severity'] == 'catastrophic':
+            failures.append('{grammar}: {pattern}'.format(**pattern))
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({'results': results, 'flagged': flagged, 'failures': failures}, json_file, indent=2)
+    if failures:
+        print('over budget:\n  ' + '\n  '.join(failures))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
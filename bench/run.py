@@ -0,0 +1,246 @@
+"""
+Headless benchmarks for the plugin's hot paths, run against a synthetic
+project with fake elm-oracle and elm-make executables that replay recorded
+output. Prints throughput and latency per benchmark.
+
+Usage: python bench/run.py [--modules N] [--entries N] [--json PATH] [name ...]
+"""
+import argparse
+import json
+import os
+import os.path as fs
+import random
+import shutil
+import string
+import tempfile
+import time
+
+import fixtures
+import stubs
+
+HERE = fs.dirname(fs.abspath(__file__))
+MAKE_REPORT = fs.join(HERE, 'fixtures', 'elm-make-report.txt')
+CHUNK_SIZE = 4096
+BENCHMARKS = []
+
+def benchmark(function):
+    BENCHMARKS.append(function)
+    return function
+
+def measure(name, function, inputs):
+    """
+    Call `function` once per input and summarize the latencies.
+    """
+    latencies = []
+    for value in inputs:
+        start = time.time()
+        function(value)
+        latencies.append((time.time() - start) * 1000)
+    latencies.sort()
+    total = sum(latencies)
+    percentile = lambda p: latencies[min(int(len(latencies) * p), len(latencies) - 1)]
+    return {'name': name, 'calls': len(latencies), 'per_second': len(latencies) / (total / 1000) if total else 0,
+        'mean': total / len(latencies), 'p50': percentile(0.5), 'p99': percentile(0.99), 'max': latencies[-1]}
+
+def imported_entries(context, filename):
+    """
+    Return the entries of the modules `filename` imports, the only ones it
+    can look up or complete.
+    """
+    from elm_oracle import module_name, parse_imports, read_imports
+    modules = parse_imports(read_imports(filename))
+    return [entry for entry in context['entries'] if module_name(entry['fullName']) in modules]
+
+def sample_queries(rng, entries, count):
+    queries = []
+    for _ in range(count):
+        entry = rng.choice(entries)
+        queries.append(rng.choice([entry['name'], entry['fullName'], 'P0.' + entry['name']]))
+    return queries
+
+def sample_prefixes(rng, entries, count):
+    prefixes = []
+    for _ in range(count):
+        entry = rng.choice(entries)
+        word = rng.choice([entry['name'], entry['fullName']])
+        prefixes.append(word[:rng.randint(1, min(len(word), 6))])
+    return prefixes
+
+@benchmark
+def oracle_load(context):
+    import elm_oracle
+    import elm_show_type
+    filename = context['project']['elm_files'][0]
+
+    def cold(_):
+        elm_oracle.PROJECTS.clear()
+        elm_show_type.load_from_oracle(filename)
+
+    def project_files(_):
+        elm_oracle.PROJECTS.clear()
+        for elm_file in context['project']['elm_files'][:30]:
+            elm_show_type.load_from_oracle(elm_file)
+
+    results = [measure('load_from_oracle (spawn)', cold, range(5))]
+    results.append(measure('load_from_oracle (cached)', elm_show_type.load_from_oracle, [filename] * 200))
+    results.append(measure('load_from_oracle (spawn, 30 files)', project_files, range(1)))
+    root = context['project']['root']
+    fixtures.write_package_docs(root, context['entries'])
+
+    def cold_docs(_):
+        elm_oracle.DOCS.clear()
+        cold(_)
+
+    try:
+        results.append(measure('load_from_oracle (documentation.json)', cold_docs, range(5)))
+        results.append(measure('load_from_oracle (parsed documentation)', cold, range(20)))
+        results.append(measure('load_from_oracle (documentation, 30 files)', project_files, range(3)))
+    finally:
+        shutil.rmtree(fs.join(root, 'elm-stuff'))
+        elm_oracle.PROJECTS.clear()
+    return results
+
+@benchmark
+def oracle_index(context):
+    from elm_oracle import OracleIndex
+    entries = context['entries']
+    return [measure('OracleIndex build', lambda _: OracleIndex(entries), range(3))]
+
+@benchmark
+def show_type(context):
+    import elm_show_type
+    filename = context['project']['elm_files'][0]
+    elm_show_type.load_from_oracle(filename)
+    panel = stubs.View()
+    queries = sample_queries(context['rng'], imported_entries(context, filename), 5000)
+    results = [measure('search_and_set_status_message',
+        lambda query: elm_show_type.search_and_set_status_message(filename, query, panel), queries)]
+    results.append(measure('search_and_set_status_message (same word)',
+        lambda query: elm_show_type.search_and_set_status_message(filename, queries[0], panel), queries))
+    return results
+
+@benchmark
+def completions(context):
+    import elm_show_type
+    filename = context['project']['elm_files'][0]
+    elm_show_type.load_from_oracle(filename)
+    prefixes = sample_prefixes(context['rng'], imported_entries(context, filename), 2000)
+    typed = []
+    for prefix in prefixes[:200]:
+        typed.extend(prefix[:n] for n in range(1, len(prefix) + 1))
+    return [
+        measure('get_matching_names', lambda prefix: elm_show_type.get_matching_names(filename, prefix), prefixes),
+        measure('get_matching_names (typing)', lambda prefix: elm_show_type.get_matching_names(filename, prefix), typed),
+    ]
+
+@benchmark
+def make(context):
+    from elm_make import ElmMakeCommand
+    os.environ['ELM_BENCH_MAKE_OUTPUT'] = MAKE_REPORT
+    os.environ['ELM_BENCH_MAKE_REPEAT'] = '2000'
+    main_path = context['project']['elm_files'][-1]
+
+    def build(_):
+        command = ElmMakeCommand()
+        command.run(cmd=['elm-make', main_path, '--output={null}', '--report=json', '--yes'],
+            working_dir=context['project']['root'],
+            path=stubs.FAKE_BIN + os.pathsep + os.environ['PATH'],
+            error_format='==== $type in $file:$line:$column: ====\n$message\n----',
+            info_format='=== $info ===',
+            syntax='Elm Compile Messages.hidden-tmLanguage', color_scheme='Sunburst.tmTheme',
+            null_device='/dev/null', warnings='true')
+
+    def formatter():
+        command = ElmMakeCommand()
+        command.buffer = []
+        command.warnings = True
+        command.error_format = string.Template('==== $type in $file:$line:$column: ====\n$message\n----')
+        command.info_format = string.Template('=== $info ===')
+        return command
+
+    def replay(report):
+        # the output as the process reader hands it over, without a process
+        command = formatter()
+        for start in range(0, len(report), CHUNK_SIZE):
+            command.on_data(None, report[start:start + CHUNK_SIZE])
+        command.on_finished(None)
+
+    with open(MAKE_REPORT, 'rb') as report:
+        recorded = report.read()
+    lines = recorded.splitlines(True)
+    report = lines[0] + b''.join(lines[1:-1]) * 2000 + lines[-1]
+    return [
+        measure('ElmMakeCommand.run (6000 reports)', build, range(3)),
+        measure('ElmMakeCommand.on_data (6000 reports)', replay, [report] * 3),
+        measure('ElmMakeCommand.format_result', formatter().format_result, recorded.decode('utf-8').splitlines() * 500),
+    ]
+
+@benchmark
+def project(context):
+    import elm_graph
+    from elm_project import ElmProject
+    elm_files = context['project']['elm_files']
+
+    def cold_graph(path):
+        elm_graph.GRAPHS.clear()
+        ElmProject(path).module_graph()
+
+    graph = ElmProject(elm_files[0]).module_graph()
+    return [
+        measure('ElmProject()', ElmProject, elm_files * 4),
+        measure('ElmProject().elm_files()', lambda path: ElmProject(path).elm_files(), elm_files[:5]),
+        measure('ElmProject().module_graph() (cold)', cold_graph, elm_files[:3]),
+        measure('ElmProject().module_graph()', lambda path: ElmProject(path).module_graph(), elm_files[:5]),
+        measure('ElmProject().scanned_module_graph()', lambda path: ElmProject(path).scanned_module_graph(),
+            elm_files[:200]),
+        measure('ModuleGraph.update', graph.update, elm_files[:200]),
+        measure('ModuleGraph.affected_mains', graph.affected_mains, elm_files * 4),
+    ]
+
+@benchmark
+def generate(context):
+    import elm_generate
+    rng = context['rng']
+    docs = fixtures.docs_modules(rng, fixtures.package_modules(rng, 200), 40)
+    modules = [elm_generate.Module(module) for module in docs]
+    return [
+        measure('elm_generate.Module', elm_generate.Module, docs),
+        measure('Module.moduleText', lambda module: module.moduleText(), modules),
+        measure('make_autocomplete', elm_generate.make_autocomplete, [v for m in modules for v in m.values]),
+    ]
+
+def print_results(results):
+    print('{0:<46}{1:>8}{2:>12}{3:>10}{4:>10}{5:>10}{6:>10}'.format(
+        'benchmark (ms)', 'calls', 'calls/s', 'mean', 'p50', 'p99', 'max'))
+    for result in results:
+        print('{name:<46}{calls:>8}{per_second:>12.0f}{mean:>10.3f}{p50:>10.3f}{p99:>10.3f}{max:>10.3f}'.format(**result))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('names', nargs='*', help='benchmarks to run, all by default')
+    parser.add_argument('--modules', type=int, default=500)
+    parser.add_argument('--entries', type=int, default=20000)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    stubs.install({'elm_paths': stubs.FAKE_BIN, 'elm_oracle_cache_size': 0})
+    root = tempfile.mkdtemp(prefix='elm-bench-')
+    try:
+        project = fixtures.make_project(root, args.modules, args.entries)
+        os.environ['ELM_BENCH_ORACLE_OUTPUT'] = project['oracle']
+        with open(project['oracle']) as oracle_file:
+            entries = json.load(oracle_file)
+        context = {'project': project, 'entries': entries, 'rng': random.Random(2)}
+        results = []
+        for function in BENCHMARKS:
+            if not args.names or function.__name__ in args.names:
+                results.extend(function(context))
+    finally:
+        shutil.rmtree(root)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(results, json_file, indent=4)
+
+if __name__ == '__main__':
+    main()
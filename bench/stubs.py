@@ -0,0 +1,201 @@
+"""
+Stand-ins for the parts of the Sublime Text API the plugin modules use, so
+they can be imported and benchmarked outside the editor.
+"""
+import atexit
+import os
+import os.path as fs
+import shutil
+import subprocess
+import sys
+import tempfile
+import types
+
+ROOT = fs.dirname(fs.dirname(fs.abspath(__file__)))
+FAKE_BIN = fs.join(ROOT, 'bench', 'fake_bin')
+
+
+class Settings(object):
+
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+        self.callbacks = {}
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def set(self, key, value):
+        self.values[key] = value
+        for callback in list(self.callbacks.values()):
+            callback()
+
+    def erase(self, key):
+        self.values.pop(key, None)
+
+    def add_on_change(self, tag, callback):
+        self.callbacks[tag] = callback
+
+    def clear_on_change(self, tag):
+        self.callbacks.pop(tag, None)
+
+
+class Region(object):
+
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def contains(self, point):
+        return self.begin() <= point <= self.end()
+
+    def cover(self, other):
+        return Region(min(self.begin(), other.begin()), max(self.end(), other.end()))
+
+    def __eq__(self, other):
+        return (self.a, self.b) == (other.a, other.b)
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class View(object):
+    """
+    A buffer that records the commands run on it. Enough for output panels.
+    """
+    next_id = 1
+
+    def __init__(self, text='', file_name=None):
+        self.text = text
+        self.path = file_name
+        self.commands = []
+        self.view_settings = Settings()
+        self.view_id = View.next_id
+        View.next_id += 1
+
+    def id(self):
+        return self.view_id
+
+    def file_name(self):
+        return self.path
+
+    def size(self):
+        return len(self.text)
+
+    def settings(self):
+        return self.view_settings
+
+    def set_syntax_file(self, syntax):
+        pass
+
+    def run_command(self, name, args=None):
+        self.commands.append((name, args))
+        if name == 'erase_view':
+            self.text = ''
+        elif name == 'append':
+            self.text += args['characters']
+
+
+class Window(object):
+
+    def __init__(self):
+        self.panels = {}
+
+    def create_output_panel(self, name):
+        return self.panels.setdefault(name, View())
+
+    get_output_panel = create_output_panel
+
+    def run_command(self, name, args=None):
+        pass
+
+
+class ExecCommand(object):
+    """
+    Runs the build command and feeds its output to on_data in chunks, the
+    way Default.exec does, collecting whatever would reach the output panel.
+    """
+    encoding = 'utf-8'
+    CHUNK_SIZE = 4096
+
+    def __init__(self, window=None):
+        self.window = window or Window()
+        self.output_view = self.window.create_output_panel('exec')
+        self.output = []
+
+    def run(self, cmd=None, working_dir=None, path=None, **kwargs):
+        if not cmd:
+            return
+        env = dict(os.environ)
+        if path:
+            env['PATH'] = os.path.expandvars(path)
+        proc = subprocess.Popen(cmd, cwd=working_dir or None, env=env, stdout=subprocess.PIPE)
+        while True:
+            data = os.read(proc.stdout.fileno(), self.CHUNK_SIZE)
+            if not data:
+                break
+            self.on_data(proc, data)
+        proc.wait()
+        self.on_finished(proc)
+
+    def on_data(self, proc, data):
+        self.output.append(data)
+
+    def on_finished(self, proc):
+        pass
+
+
+def install(settings=None):
+    """
+    Register the stand-in modules and put the package on the import path.
+    Returns the settings of the package, which the caller can change.
+    """
+    package_settings = Settings(settings)
+    all_settings = {
+        'Elm Language Support.sublime-settings': package_settings,
+        'Elm User Strings.sublime-settings': Settings(load_strings()),
+    }
+    cache_dir = tempfile.mkdtemp(prefix='elm-bench-cache-')
+    atexit.register(shutil.rmtree, cache_dir, ignore_errors=True)
+
+    sublime = types.ModuleType('sublime')
+    sublime.version = lambda: '3126'
+    sublime.load_settings = lambda name: all_settings.setdefault(name, Settings())
+    sublime.cache_path = lambda: cache_dir
+    sublime.set_timeout = lambda callback, delay=0: callback()
+    sublime.set_timeout_async = lambda callback, delay=0: callback()
+    sublime.status_message = lambda message: None
+    sublime.error_message = lambda message: None
+    sublime.active_window = Window
+    sublime.Region = Region
+    sublime.TRANSIENT = 4
+    sys.modules['sublime'] = sublime
+
+    sublime_plugin = types.ModuleType('sublime_plugin')
+    sublime_plugin.EventListener = type('EventListener', (object,), {})
+    sublime_plugin.ApplicationCommand = type('ApplicationCommand', (object,), {})
+    sublime_plugin.TextCommand = type('TextCommand', (object,),
+        {'__init__': lambda self, view: setattr(self, 'view', view)})
+    sublime_plugin.WindowCommand = type('WindowCommand', (object,),
+        {'__init__': lambda self, window: setattr(self, 'window', window)})
+    sys.modules['sublime_plugin'] = sublime_plugin
+
+    default = types.ModuleType('Default')
+    default.exec = types.ModuleType('Default.exec')
+    default.exec.ExecCommand = ExecCommand
+    sys.modules['Default'] = default
+    sys.modules['Default.exec'] = default.exec
+
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return package_settings
+
+def load_strings():
+    import json
+    with open(fs.join(ROOT, 'Settings', 'Elm User Strings.sublime-settings')) as strings_file:
+        return json.load(strings_file)
@@ -0,0 +1,172 @@
+"""
+Checks that .sublime-syntax files tokenize the benchmark corpora with the
+same scopes as the YAML-tmLanguage grammars they were converted from, using
+a small tokenizer for the .sublime-syntax format next to tmgrammar's.
+
+Used by `python tools/sublime_syntax.py --check`.
+"""
+import io
+import re
+
+import grammar as bench_grammar
+import tmgrammar
+
+# the scopes elm_show_type.get_type and ElmFormatOnSave look for
+PLUGIN_SCOPES = ('source.elm', 'string', 'comment')
+
+
+class SyntaxRegistry(dict):
+    """
+    Parsed .sublime-syntax files by scope, for the equivalence check.
+    """
+
+    def load(self, path):
+        with io.open(path, encoding='utf-8') as syntax_file:
+            # PyYAML only understands the YAML 1.1 directive
+            data = tmgrammar.yaml.safe_load(syntax_file.read().replace('%YAML 1.2', '', 1))
+        self[data['scope']] = data
+        return data
+
+
+class SyntaxTokenizer(object):
+    """
+    Tokenizes lines with a .sublime-syntax grammar. Tokens are (start, end,
+    scopes) like the ones of tmgrammar.Tokenizer.
+    """
+
+    def __init__(self, registry, scope):
+        self.registry = registry
+        self.scope = scope
+        self.stack = [(registry[scope]['contexts']['main'], scope, None)]
+
+    def context_scopes(self, context, content=True):
+        scopes = []
+        for item in context:
+            if 'meta_scope' in item:
+                scopes.append(item['meta_scope'])
+            if content and 'meta_content_scope' in item:
+                scopes.append(item['meta_content_scope'])
+        return scopes
+
+    def base_scopes(self, exclude_content_of_top=False):
+        scopes = [self.scope]
+        for i, (context, syntax, push_match) in enumerate(self.stack):
+            top = i == len(self.stack) - 1
+            scopes.extend(self.context_scopes(context, not (top and exclude_content_of_top)))
+        return scopes
+
+    def matches(self, context, syntax, seen=None):
+        seen = seen if seen is not None else set()
+        if id(context) in seen:
+            return
+        seen.add(id(context))
+        for item in context:
+            if 'include' in item:
+                include = item['include']
+                if include.startswith('scope:'):
+                    other = include[len('scope:'):]
+                    if other in self.registry:
+                        for match in self.matches(self.registry[other]['contexts']['main'], other, seen):
+                            yield match
+                else:
+                    for match in self.matches(self.registry[syntax]['contexts'][include], syntax, seen):
+                        yield match
+            elif 'match' in item:
+                yield item, syntax
+
+    def tokenize_line(self, line):
+        tokens = []
+        pos = 0
+        while pos < len(line):
+            context, syntax, push_match = self.stack[-1]
+            best = None
+            for item, item_syntax in self.matches(context, syntax):
+                source = item['match']
+                if item.get('pop') and push_match is not None:
+                    source = tmgrammar.BACKREF_RE.sub(
+                        lambda m: re.escape(push_match.group(int(m.group(1))) or ''), source)
+                match = tmgrammar.compile_regex(source).search(line, pos)
+                if match and (best is None or match.start() < best[1].start()):
+                    best = (item, match, item_syntax)
+                    if match.start() == pos:
+                        break
+            if best is None:
+                tokens.append((pos, len(line), self.base_scopes()))
+                break
+            item, match, item_syntax = best
+            if match.start() > pos:
+                tokens.append((pos, match.start(), self.base_scopes()))
+            if item.get('pop'):
+                scopes = self.base_scopes(exclude_content_of_top=True)
+                self.stack.pop()
+            elif 'push' in item:
+                scopes = self.base_scopes() + self.context_scopes(item['push'], content=False)
+                self.stack.append((item['push'], item_syntax, match))
+            else:
+                scopes = self.base_scopes()
+            if 'scope' in item:
+                scopes = scopes + item['scope'].split()
+            captures = dict((str(group), {'name': name}) for group, name in item.get('captures', {}).items())
+            tokens.extend(tmgrammar.capture_tokens(match, scopes, captures))
+            if match.end() == pos and not item.get('pop') and 'push' not in item:
+                tokens.append((pos, pos + 1, self.base_scopes()))
+                pos += 1
+            else:
+                pos = match.end()
+        return [token for token in tokens if token[1] > token[0]]
+
+
+def char_scopes(tokens):
+    """
+    Return the scope string of every character covered by `tokens`.
+    """
+    return [' '.join(scopes) for start, end, scopes in tokens for _ in range(end - start)]
+
+def compare(grammar, tokenizer, text):
+    """
+    Tokenize `text` with both engines and return the first few lines where
+    their scopes differ, along with how many characters the plugin scopes
+    cover in each.
+    """
+    old = tmgrammar.Tokenizer(grammar)
+    differences = []
+    counts = dict((scope, [0, 0]) for scope in PLUGIN_SCOPES)
+    for number, line in enumerate(text.splitlines(True), 1):
+        line = line if line.endswith('\n') else line + '\n'
+        old_scopes = char_scopes(old.tokenize_line(line))
+        new_scopes = char_scopes(tokenizer.tokenize_line(line))
+        for scope in PLUGIN_SCOPES:
+            counts[scope][0] += sum(1 for s in old_scopes if scope in s)
+            counts[scope][1] += sum(1 for s in new_scopes if scope in s)
+        if old_scopes != new_scopes and len(differences) < 5:
+            column = next((i for i, (a, b) in enumerate(zip(old_scopes, new_scopes)) if a != b),
+                min(len(old_scopes), len(new_scopes)))
+            differences.append((number, column, line.rstrip('\n'),
+                old_scopes[column] if column < len(old_scopes) else None,
+                new_scopes[column] if column < len(new_scopes) else None))
+    return differences, counts
+
+def check(paths):
+    """
+    Tokenize the benchmark corpora with the YAML-tmLanguage grammars and the
+    .sublime-syntax files at `paths`, and return where their scopes differ.
+    """
+    failures = []
+    registry = tmgrammar.Registry().load_package()
+    syntaxes = SyntaxRegistry()
+    for path in paths:
+        syntaxes.load(path)
+    texts = bench_grammar.elm_corpus([bench_grammar.CORPUS])
+    corpora = [('source.elm', name, text) for name, text in texts]
+    corpora.append(('text.html.mediawiki.elm-build-output', 'elm-make report', bench_grammar.compile_messages()))
+    corpora.append(('text.html.mediawiki.elm-documentation', 'doc comments', bench_grammar.documentation(texts)))
+    for scope, name, text in corpora:
+        differences, counts = compare(registry[scope], SyntaxTokenizer(syntaxes, scope), text)
+        print('{0} on {1}: {2}'.format(scope, name, 'same scopes' if not differences else 'scopes differ'))
+        for scope_name, (old_count, new_count) in sorted(counts.items()):
+            print('  {0}: {1} characters, {2} before'.format(scope_name, new_count, old_count))
+        for number, column, line, old_scope, new_scope in differences:
+            print('  line {0}, column {1}: {2}\n    before: {3}\n    after:  {4}'.format(
+                number, column + 1, line, old_scope, new_scope))
+            failures.append('{0} on {1}: line {2}'.format(scope, name, number))
+    return failures
@@ -0,0 +1,255 @@
+"""
+A small TextMate grammar tokenizer for YAML-tmLanguage files, close enough
+to Sublime's engine to time patterns and compare scopes headlessly.
+
+Oniguruma syntax is translated to Python's `re`: `^` and `$` are always
+line anchors and `\\x{HHHH}` escapes become `\\uHHHH`. Lines are tokenized
+one at a time, each with its trailing newline, as TextMate does.
+"""
+import os.path as fs
+import re
+import time
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+SYNTAXES = fs.join(fs.dirname(fs.dirname(fs.abspath(__file__))), 'Syntaxes')
+HEX_ESCAPE_RE = re.compile(r'\\x\{([0-9A-Fa-f]+)\}')
+BACKREF_RE = re.compile(r'\\(\d)')
+
+
+def compile_regex(source):
+    source = HEX_ESCAPE_RE.sub(lambda m: '\\u' + m.group(1).zfill(4), source)
+    return re.compile(source, re.MULTILINE)
+
+
+class Pattern(object):
+    """
+    A regex of a rule, timed every time it is searched.
+    """
+
+    def __init__(self, label, source):
+        self.label = label
+        self.source = source
+        self.regex = compile_regex(source) if not self.has_backrefs() else None
+        self.calls = 0
+        self.seconds = 0.0
+
+    def has_backrefs(self):
+        return self.label.endswith(' end') and bool(BACKREF_RE.search(self.source))
+
+    def search(self, line, pos, regex=None, cache=None):
+        regex = regex or self.regex
+        # like TextMate engines, reuse a match that is still ahead of `pos`
+        # instead of scanning the rest of the line again
+        if cache is not None and regex in cache:
+            match = cache[regex]
+            if match is None or match.start() >= pos:
+                return match
+        start = time.perf_counter()
+        match = regex.search(line, pos)
+        self.seconds += time.perf_counter() - start
+        self.calls += 1
+        if cache is not None:
+            cache[regex] = match
+        return match
+
+    def resolve(self, begin_match):
+        """
+        Return the end regex with back references to the begin match filled in.
+        """
+        if self.regex is not None:
+            return self.regex
+        return compile_regex(BACKREF_RE.sub(
+            lambda m: re.escape(begin_match.group(int(m.group(1))) or ''), self.source))
+
+
+class Rule(object):
+
+    def __init__(self, grammar, data, label):
+        self.grammar = grammar
+        self.label = label
+        self.name = data.get('name')
+        self.content_name = data.get('contentName')
+        self.include = data.get('include')
+        self.captures = data.get('captures', {})
+        self.begin_captures = data.get('beginCaptures', self.captures)
+        self.end_captures = data.get('endCaptures', self.captures)
+        self.apply_end_last = bool(data.get('applyEndPatternLast'))
+        describe = self.name or data.get('comment') or self.include or ''
+        self.match = Pattern(label + ' ' + describe + ' match', data['match']) if 'match' in data else None
+        self.begin = Pattern(label + ' ' + describe + ' begin', data['begin']) if 'begin' in data else None
+        self.end = Pattern(label + ' ' + describe + ' end', data['end']) if 'end' in data else None
+        self.children = [Rule(grammar, child, '{0}.{1}'.format(label, i))
+            for i, child in enumerate(data.get('patterns', []))]
+
+    def patterns(self):
+        return [pattern for pattern in (self.match, self.begin, self.end) if pattern]
+
+    def expand(self, seen=None):
+        """
+        Return the match and begin rules this rule stands for, following includes.
+        """
+        seen = seen if seen is not None else set()
+        if id(self) in seen:
+            return []
+        seen.add(id(self))
+        if self.include:
+            target = self.grammar.resolve(self.include)
+            return target.expand(seen) if target else []
+        if self.match or self.begin:
+            return [self]
+        return [rule for child in self.children for rule in child.expand(seen)]
+
+
+class Grammar(object):
+
+    def __init__(self, data, registry):
+        self.registry = registry
+        self.name = data.get('name')
+        self.scope = data['scopeName']
+        self.repository = {}
+        for key, value in (data.get('repository') or {}).items():
+            self.repository[key] = Rule(self, value, '#' + key)
+        self.root = Rule(self, {'patterns': data.get('patterns', [])}, self.scope)
+
+    def resolve(self, include):
+        if include.startswith('#'):
+            return self.repository.get(include[1:])
+        if include == '$self':
+            return self.root
+        grammar = self.registry.get(include)
+        return grammar.root if grammar else None
+
+    def rules(self):
+        stack = [self.root] + list(self.repository.values())
+        while stack:
+            rule = stack.pop()
+            yield rule
+            stack.extend(rule.children)
+
+    def patterns(self):
+        return [pattern for rule in self.rules() for pattern in rule.patterns()]
+
+    def reset_timings(self):
+        for pattern in self.patterns():
+            pattern.calls = 0
+            pattern.seconds = 0.0
+
+
+class Registry(dict):
+    """
+    Grammars by scope name, so `include: source.elm` works across files.
+    """
+
+    def load(self, path):
+        if yaml is None:
+            raise ImportError('PyYAML is needed to read YAML-tmLanguage files')
+        with open(path) as grammar_file:
+            data = yaml.safe_load(grammar_file)
+        grammar = self[data['scopeName']] = Grammar(data, self)
+        return grammar
+
+    def load_package(self):
+        for name in ('Elm', 'Elm Modules', 'Elm Documentation', 'Elm Compile Messages'):
+            self.load(fs.join(SYNTAXES, name + '.YAML-tmLanguage'))
+        return self
+
+
+class Frame(object):
+
+    def __init__(self, rule, end, scopes, content_scopes):
+        self.rule = rule
+        self.end = end
+        self.scopes = scopes
+        self.content_scopes = content_scopes
+        self.children = [child for rule_child in rule.children for child in rule_child.expand()]
+
+
+class Tokenizer(object):
+    """
+    Tokenizes lines with a grammar, keeping the begin/end state between lines.
+    Each token is (start, end, scopes).
+    """
+
+    def __init__(self, grammar):
+        self.grammar = grammar
+        root = grammar.root
+        self.stack = [Frame(root, None, [grammar.scope], [grammar.scope])]
+
+    def tokenize_line(self, line):
+        tokens = []
+        cache = {}
+        pos = 0
+        while pos < len(line):
+            frame = self.stack[-1]
+            best = None
+            candidates = [(rule, rule.match or rule.begin) for rule in frame.children]
+            if frame.end is not None:
+                end = (None, frame.rule.end)
+                candidates = candidates + [end] if frame.rule.apply_end_last else [end] + candidates
+            for rule, pattern in candidates:
+                match = pattern.search(line, pos, frame.end if rule is None else None, cache)
+                if match and (best is None or match.start() < best[1].start()):
+                    best = (rule, match)
+                    if match.start() == pos:
+                        break
+            if best is None:
+                tokens.append((pos, len(line), frame.content_scopes))
+                break
+            rule, match = best
+            if match.start() > pos:
+                tokens.append((pos, match.start(), frame.content_scopes))
+            if rule is None:
+                self.stack.pop()
+                tokens.extend(capture_tokens(match, frame.scopes, frame.rule.end_captures))
+            elif rule.match:
+                scopes = frame.content_scopes + ([rule.name] if rule.name else [])
+                tokens.extend(capture_tokens(match, scopes, rule.captures))
+            else:
+                scopes = frame.content_scopes + ([rule.name] if rule.name else [])
+                tokens.extend(capture_tokens(match, scopes, rule.begin_captures))
+                content_scopes = scopes + ([rule.content_name] if rule.content_name else [])
+                self.stack.append(Frame(rule, rule.end.resolve(match), scopes, content_scopes))
+            if match.end() == pos and (rule is None or rule.match):
+                # an empty match that changes nothing, skip a character
+                tokens.append((pos, pos + 1, self.stack[-1].content_scopes))
+                pos += 1
+            else:
+                pos = match.end()
+        return [token for token in tokens if token[1] > token[0]]
+
+
+def capture_tokens(match, scopes, captures):
+    """
+    Split a match into tokens at its capture boundaries, each scoped by the
+    captures covering it.
+    """
+    groups = []
+    for key, capture in captures.items():
+        group = int(key)
+        if capture.get('name') and group <= (match.re.groups or 0) and match.start(group) != -1:
+            groups.append((group, match.start(group), match.end(group), capture['name']))
+    if not groups:
+        return [(match.start(), match.end(), scopes)]
+    bounds = sorted(set([match.start(), match.end()] + [g[1] for g in groups] + [g[2] for g in groups]))
+    tokens = []
+    for start, end in zip(bounds, bounds[1:]):
+        covering = sorted(g for g in groups if g[1] <= start and end <= g[2])
+        tokens.append((start, end, scopes + [g[3] for g in covering]))
+    return tokens
+
+
+def tokenize(grammar, text):
+    """
+    Return the tokens of every line of `text` as (line, [(text, scopes)]).
+    """
+    tokenizer = Tokenizer(grammar)
+    result = []
+    for line in text.splitlines(True):
+        if not line.endswith('\n'):
+            line += '\n'
+        result.append((line, [(line[start:end], scopes) for start, end, scopes in tokenizer.tokenize_line(line)]))
+    return result
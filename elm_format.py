@@ -1,50 +1,201 @@
 from __future__ import print_function
 
-import subprocess
 import os, os.path
 import re
+import difflib
+import hashlib
+import json
+import threading
+import time
 import sublime, sublime_plugin
 
+try:     # ST3
+	from .elm_plugin import RUNNER, STRINGS, count, get_setting, get_string, timed
+	from .elm_project import ElmProject
+except:  # ST2
+	from elm_plugin import RUNNER, STRINGS, count, get_setting, get_string, timed
+	from elm_project import ElmProject
+
+
+def elm_format(text):
+	"""
+	Pipes Elm source through elm-format and returns the formatted source,
+	or None if elm-format failed.
+	"""
+
+	with timed('format.spawn'):
+		result = RUNNER.run(['elm-format', '--stdin'], input=text.encode('utf-8'))
+
+	if get_setting('debug', False):
+	    print(STRINGS.get('logging.prefix', '') + '(elm-format) ' + str(result.output.strip()), '\nerrors: ' + str(result.errors.strip()))
+	    if str(result.errors.strip()):
+	        print('Your PATH is: ', RUNNER.search_path())
+
+	if result.returncode != 0:
+		return None
+	return result.output.decode('utf-8').replace('\r\n', '\n')
+
 
 class ElmFormatCommand(sublime_plugin.TextCommand):
+	"""
+	Formats the buffer with elm-format off the UI thread. The result is
+	dropped if the buffer changes while elm-format runs.
+	"""
+	def run(self, edit, save=False):
+		view = self.view
+		text = view.substr(sublime.Region(0, view.size()))
+		change_count = view.change_count()
+
+		def format_async():
+			formatted = elm_format(text)
+			if formatted is not None and formatted != text:
+				args = {'formatted': formatted, 'change_count': change_count, 'save': save}
+				sublime.set_timeout(lambda: view.run_command('elm_format_apply', args), 0)
+
+		sublime.set_timeout_async(format_async, 0)
+
+
+class ElmFormatApplyCommand(sublime_plugin.TextCommand):
+	"""
+	Replaces only the lines elm-format changed, so the cursor and undo
+	history stay intact.
+	"""
+	def run(self, edit, formatted, change_count, save=False):
+		view = self.view
+		if view.change_count() != change_count:
+			return
+		old_lines = view.substr(sublime.Region(0, view.size())).splitlines(True)
+		new_lines = formatted.splitlines(True)
+		offsets = [0]
+		for line in old_lines:
+			offsets.append(offsets[-1] + len(line))
+		opcodes = difflib.SequenceMatcher(None, old_lines, new_lines, False).get_opcodes()
+		# apply from the end so earlier offsets stay valid
+		for tag, i1, i2, j1, j2 in reversed(opcodes):
+			if tag != 'equal':
+				view.replace(edit, sublime.Region(offsets[i1], offsets[i2]), ''.join(new_lines[j1:j2]))
+		if save:
+			view.settings().set('elm_format.saving', True)
+			view.run_command('save')
+
+
+class ElmFormatProjectCommand(sublime_plugin.TextCommand):
+	"""
+	Formats every Elm file in the source directories of the project with a
+	small pool of elm-format processes. Files that haven't changed since
+	they were last formatted are skipped, and so are files with unsaved
+	changes in a view, which writing them behind the editor would clobber.
+	"""
+	def is_enabled(self):
+		self.project = ElmProject(self.view.file_name())
+		return self.project.exists
+
 	def run(self, edit):
+		# views can only be asked on this thread
+		modified = [view.file_name() for window in sublime.windows() for view in window.views()
+			if view.file_name() and view.is_dirty()]
+		threading.Thread(target=FormatBatch(self.project, modified).run).start()
+
+
+class FormatBatch(object):
+	"""
+	A run of elm-format over many files, on a thread of its own. Hashes of
+	the formatted files are kept in Sublime's cache directory, so later
+	runs skip them until they change.
+	"""
+	def __init__(self, project, modified=()):
+		self.project = project
+		self.modified = set(os.path.normpath(path) for path in modified)
+		self.lock = threading.Lock()
+		self.done = 0
+		self.counts = {'formatted': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0}
+		self.hashes_path = os.path.join(sublime.cache_path(), 'Elm Language Support', 'format-hashes.json')
 
-		# Hide the console window on Windows
-		shell = False
-		path_separator = ':'
-		if os.name == "nt":
-		    shell = True
-		    path_separator = ';'
+	def run(self):
+		start = time.time()
+		self.paths = self.project.elm_files()
+		self.queue = iter(self.paths)
+		self.hashes = self.load_hashes()
+		workers = [threading.Thread(target=self.work) for _ in range(max(get_setting('elm_format_workers', 4), 1))]
+		for worker in workers:
+			worker.start()
+		for worker in workers:
+			worker.join()
+		self.save_hashes()
+		sublime.status_message(get_string('format.project.finished', self.counts['formatted'],
+			self.counts['unchanged'], self.counts['skipped'], self.counts['failed'], time.time() - start))
 
-		settings = sublime.load_settings('Elm Language Support.sublime-settings')
-		path = settings.get('elm_paths', '')
-		if path:
-			old_path = os.environ['PATH']
-			os.environ['PATH'] = os.path.expandvars(path + path_separator + '$PATH')
+	def work(self):
+		while True:
+			with self.lock:
+				path = next(self.queue, None)
+			if path is None:
+				return
+			result = self.format_file(path)
+			with self.lock:
+				self.counts[result] += 1
+				self.done += 1
+				sublime.status_message(get_string('format.project.progress', self.done, len(self.paths)))
 
-		command = ['elm-format', self.view.file_name(), '--yes']
-		p = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=shell)
+	def format_file(self, path):
+		if os.path.normpath(path) in self.modified:
+			return 'skipped'
+		try:
+			with open(path, 'rb') as elm_file:
+				source = elm_file.read()
+		except (IOError, OSError):
+			return 'failed'
+		if self.hashes.get(path) == hashlib.sha1(source).hexdigest():
+			count('format.project.skipped')
+			return 'skipped'
+		try:
+			text = source.decode('utf-8').replace('\r\n', '\n')
+		except UnicodeDecodeError:
+			return 'failed'
+		formatted = elm_format(text)
+		if formatted is None:
+			return 'failed'
+		result = 'unchanged'
+		if formatted != text:
+			source = formatted.encode('utf-8')
+			try:
+				with open(path, 'wb') as elm_file:
+					elm_file.write(source)
+			except (IOError, OSError):
+				return 'failed'
+			result = 'formatted'
+		with self.lock:
+			self.hashes[path] = hashlib.sha1(source).hexdigest()
+		return result
 
-		if path:
-			os.environ['PATH'] = old_path
+	def load_hashes(self):
+		try:
+			with open(self.hashes_path) as hashes_file:
+				return json.load(hashes_file)
+		except (IOError, OSError, ValueError):
+			return {}
 
-		output, errors = p.communicate()
-		
-		if settings.get('debug', False):
-		    string_settings = sublime.load_settings('Elm User Strings.sublime-settings')
-		    print(string_settings.get('logging.prefix', '') + '(elm-format) ' + str(output.strip()), '\nerrors: ' + str(errors.strip()))
-		    if str(errors.strip()):
-		        print('Your PATH is: ', os.environ['PATH'])
+	def save_hashes(self):
+		try:
+			if not os.path.isdir(os.path.dirname(self.hashes_path)):
+				os.makedirs(os.path.dirname(self.hashes_path))
+			with open(self.hashes_path, 'w') as hashes_file:
+				json.dump(self.hashes, hashes_file)
+		except (IOError, OSError):
+			pass
 
 
 class ElmFormatOnSave(sublime_plugin.EventListener):
 	def on_post_save(self, view):
+		if view.settings().get('elm_format.saving'):
+			# this is the save of our own formatting
+			view.settings().erase('elm_format.saving')
+			return
 		sel = view.sel()[0]
 		region = view.word(sel)
 		scope = view.scope_name(region.b)
 		if scope.find('source.elm') != -1:
-			settings = sublime.load_settings('Elm Language Support.sublime-settings')
-			if settings.get('elm_format_on_save', True):
-				regex = settings.get('elm_format_filename_filter', '')
+			if get_setting('elm_format_on_save', True):
+				regex = get_setting('elm_format_filename_filter', '')
 				if not (len(regex) > 0 and re.search(regex, view.file_name()) is not None):
-					view.run_command('elm_format')
+					view.run_command('elm_format', {'save': True})
@@ -1,6 +1,15 @@
+import argparse
+import hashlib
 import json
 import os
-import sys
+import plistlib
+import threading
+import uuid
+
+try:
+	import queue
+except ImportError: # Python 2
+	import Queue as queue
 
 class Module(object):
 	def __init__(self, data):
@@ -17,30 +26,218 @@ class Module(object):
 
 	def moduleText(self):
 		s = '<key>{nameLower}</key>\n<dict>\n\t<key>captures</key>\n\t<dict>\n\t\t<key>1</key>\n\t\t<dict>\n\t\t\t<key>name</key>\n\t\t\t<string>variable.parameter</string>\n\t\t</dict>\n\t\t<key>2</key>\n\t\t<dict>\n\t\t\t<key>name</key>\n\t\t\t<string>variable.parameter</string>\n\t\t</dict>\n\t\t<key>3</key>\n\t\t<dict>\n\t\t\t<key>name</key>\n\t\t\t<string>support.function.elm</string>\n\t\t</dict>\n\t</dict>\n\t<key>match</key>\n\t<string>\\b({name})(.)({values})\\b</string>\n\t<key>name</key>\n\t<string>variable.parameter</string>\n</dict>'
+		return s.format(nameLower=self.name.lower(), name=self.name, values=self.value_pattern())
+
+	def value_pattern(self):
 		values = '|'.join([n for n in self.valueNames if not n.startswith('(')])
 		if self.aliases:
 			values += '|' + '|'.join(self.aliases)
 		if self.datatypes:
 			values += '|' + '|'.join(self.datatypes)
-		return s.format(nameLower=self.name.lower(), name=self.name, values=values)
-
-	def snippets(self):
-		base = 'Snippets'
+		return values
+
+	def rule(self):
+		return {
+			'name': 'variable.parameter',
+			'match': '\\b({name})(.)({values})\\b'.format(name=self.name, values=self.value_pattern()),
+			'captures': {
+				'1': {'name': 'variable.parameter'},
+				'2': {'name': 'variable.parameter'},
+				'3': {'name': 'support.function.elm'},
+			},
+		}
+
+	def snippet_files(self, base='Snippets'):
 		s = '<snippet>\n\t<content><![CDATA[\n{autocomplete}\n]]></content>\n\t<!-- Optional: Set a tabTrigger to define how to trigger the snippet -->\n\t<tabTrigger>{name}</tabTrigger>\n\t<!-- Optional: Set a scope to limit where the snippet will trigger -->\n\t<scope>source.elm</scope>\n\t<description>{signature}</description>\n</snippet>'
+		directory = os.path.join(base, *self.name.split('.'))
 		for v in [func for func in self.values if not name(func).startswith('(')]:
-			subdirectories = self.name.split('.')
-			path = '{}' + '\\{}'*(len(subdirectories))
-			path = path.format(base, *subdirectories)
-
-			if not os.path.exists(path):
-				os.makedirs(path)
-
-			path += '\\{}'
-
-			with open(path.format(name(v) + '.sublime-snippet'), 'w') as f:
-				f.write(s.format(autocomplete=make_autocomplete(v), name=name(v), signature=signature(v)))
+			path = os.path.join(directory, name(v) + '.sublime-snippet')
+			yield path, s.format(autocomplete=make_autocomplete(v), name=name(v), signature=signature(v))
 
-			print('Wrote {}'.format(path.format(name(v) + '.sublime-snippet')))
+	def snippets(self, writer=None):
+		if writer is None:
+			with SnippetWriter() as writer:
+				writer.write_all(self.snippet_files())
+		else:
+			writer.write_all(self.snippet_files())
+
+
+class SnippetWriter(object):
+	"""
+	Writes files from a few threads, handing them over in batches.
+	"""
+	def __init__(self, workers=4, batch_size=64):
+		self.batch_size = batch_size
+		self.batch = []
+		self.written = 0
+		self.lock = threading.Lock()
+		self.queue = queue.Queue(maxsize=workers * 2)
+		self.threads = [threading.Thread(target=self.work) for _ in range(workers)]
+		for thread in self.threads:
+			thread.start()
+
+	def write(self, path, content):
+		self.batch.append((path, content))
+		if len(self.batch) >= self.batch_size:
+			self.flush()
+
+	def write_all(self, files):
+		for path, content in files:
+			self.write(path, content)
+
+	def flush(self):
+		if self.batch:
+			self.queue.put(self.batch)
+			self.batch = []
+
+	def close(self):
+		self.flush()
+		for _ in self.threads:
+			self.queue.put(None)
+		for thread in self.threads:
+			thread.join()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def work(self):
+		while True:
+			batch = self.queue.get()
+			if batch is None:
+				return
+			for path, content in batch:
+				directory = os.path.dirname(path)
+				if directory and not os.path.isdir(directory):
+					try:
+						os.makedirs(directory)
+					except OSError: # made by another thread meanwhile
+						pass
+				with open(path, 'w') as f:
+					f.write(content)
+			with self.lock:
+				self.written += len(batch)
+
+class Artifacts(object):
+	"""
+	The grammar and snippets generated from docs.json, written under `out`.
+
+	A manifest stores a content hash, the snippet files and the grammar rule
+	of every module, so modules whose docs haven't changed are not generated
+	again, and files of removed modules are deleted.
+	"""
+	MANIFEST = '.elm-generate.json'
+	GRAMMAR = os.path.join('Syntaxes', 'Elm Modules')
+	SCOPE = 'source.elm.modules'
+
+	def __init__(self, out):
+		self.out = out
+		self.old_modules = load_json(os.path.join(out, self.MANIFEST), {}).get('modules', {})
+		self.modules = {}
+		self.regenerated = 0
+
+	def add(self, data, writer):
+		digest = hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+		old = self.old_modules.get(data['name'], {})
+		if old.get('hash') == digest and all(os.path.exists(os.path.join(self.out, f)) for f in old['files']):
+			self.modules[data['name']] = old
+			return
+		m = Module(data)
+		files = []
+		for path, content in m.snippet_files(os.path.join(self.out, 'Snippets')):
+			writer.write(path, content)
+			files.append(os.path.relpath(path, self.out))
+		self.remove_files(set(old.get('files', [])) - set(files))
+		self.modules[m.name] = {'hash': digest, 'files': sorted(set(files)), 'rule': m.rule()}
+		self.regenerated += 1
+
+	def finish(self):
+		removed = [n for n in self.old_modules if n not in self.modules]
+		for module_name in removed:
+			self.remove_files(self.old_modules[module_name]['files'])
+		grammar = self.grammar()
+		write_if_changed(os.path.join(self.out, self.GRAMMAR + '.YAML-tmLanguage'), grammar_yaml(grammar))
+		write_if_changed(os.path.join(self.out, self.GRAMMAR + '.hidden-tmLanguage'), grammar_plist(grammar))
+		# written by earlier versions, when it showed up in the syntax menu
+		self.remove_files([self.GRAMMAR + '.tmLanguage'])
+		write_if_changed(os.path.join(self.out, self.MANIFEST),
+			json.dumps({'modules': self.modules}, indent=1, sort_keys=True))
+		return removed
+
+	def grammar(self):
+		keys = sorted((module_name.lower(), module_name) for module_name in self.modules)
+		return {
+			'name': 'Elm Modules',
+			'scopeName': self.SCOPE,
+			'uuid': str(uuid.uuid5(uuid.NAMESPACE_URL, self.SCOPE)),
+			'fileTypes': [],
+			'hideFromUser': True,
+			'patterns': [{'include': '#' + key} for key, module_name in keys],
+			'repository': dict((key, self.modules[module_name]['rule']) for key, module_name in keys),
+		}
+
+	def remove_files(self, files):
+		for f in files:
+			try:
+				os.remove(os.path.join(self.out, f))
+			except OSError:
+				pass
+
+def load_json(path, default):
+	try:
+		with open(path) as f:
+			return json.load(f)
+	except (IOError, OSError, ValueError):
+		return default
+
+def write_if_changed(path, content):
+	if not isinstance(content, bytes):
+		content = content.encode('utf-8')
+	try:
+		with open(path, 'rb') as f:
+			if f.read() == content:
+				return False
+	except (IOError, OSError):
+		if os.path.dirname(path) and not os.path.isdir(os.path.dirname(path)):
+			os.makedirs(os.path.dirname(path))
+	with open(path, 'wb') as f:
+		f.write(content)
+	return True
+
+def yaml_quote(s):
+	return "'" + s.replace("'", "''") + "'"
+
+def grammar_yaml(grammar):
+	lines = [
+		'# [PackageDev] target_format: plist, ext: hidden-tmLanguage',
+		'# Generated by elm_generate.py from docs.json, do not edit.',
+		'name: ' + grammar['name'],
+		'scopeName: ' + grammar['scopeName'],
+		'fileTypes: []',
+		'hideFromUser: true',
+		'uuid: ' + grammar['uuid'],
+		'',
+		'patterns:' if grammar['patterns'] else 'patterns: []',
+	]
+	lines += ['- include: ' + yaml_quote(p['include']) for p in grammar['patterns']]
+	lines += ['', 'repository:' if grammar['repository'] else 'repository: {}']
+	for key in sorted(grammar['repository']):
+		rule = grammar['repository'][key]
+		lines += [
+			'  {}:'.format(key),
+			'    name: ' + rule['name'],
+			'    match: ' + yaml_quote(rule['match']),
+			'    captures:',
+		]
+		lines += ["      '{}': {{name: {}}}".format(n, rule['captures'][n]['name']) for n in sorted(rule['captures'])]
+	return '\n'.join(lines) + '\n'
+
+def grammar_plist(grammar):
+	if hasattr(plistlib, 'dumps'):
+		return plistlib.dumps(grammar, sort_keys=True)
+	return plistlib.writePlistToString(grammar) # Python 2
 
 def name(t):
 	return t.split(' : ')[0].strip()
@@ -109,57 +306,129 @@ def loadDocs(path):
 	with open(path) as f:
 		return json.load(f)
 
+def iterDocs(path, chunk_size=1 << 16):
+	"""
+	Yields the modules of a docs.json array one at a time, reading the file
+	in chunks instead of loading all of it.
+	"""
+	decoder = json.JSONDecoder()
+	with open(path) as f:
+		buffer = ''
+		started = False
+		eof = False
+		while True:
+			buffer = buffer.lstrip()
+			if not started:
+				if buffer:
+					if buffer[0] != '[':
+						raise ValueError('docs.json must hold a list of modules')
+					buffer = buffer[1:]
+					started = True
+					continue
+			elif buffer.startswith(','):
+				buffer = buffer[1:]
+				continue
+			elif buffer.startswith(']'):
+				return
+			elif buffer:
+				try:
+					module, end = decoder.raw_decode(buffer)
+				except ValueError:
+					if eof:
+						raise
+				else:
+					yield module
+					buffer = buffer[end:]
+					continue
+			if eof:
+				raise ValueError('docs.json ended early')
+			chunk = f.read(chunk_size)
+			eof = not chunk
+			buffer += chunk
+			# read larger chunks while a single module doesn't fit
+			chunk_size *= 2 if len(buffer) > chunk_size else 1
+
+
+class Sections(object):
+	"""
+	Every section the generator prints, built up in one pass over the modules.
+	"""
+	def __init__(self, prelude):
+		self.prelude = prelude
+		self.prelude_values = []
+		self.prelude_types = []
+		self.includes = []
+		self.module_texts = []
+		self.constructors = []
+
+	def add(self, m):
+		if m.name in self.prelude:
+			self.prelude_values.append('|'.join([n for n in m.valueNames if not n.startswith('(')]))
+			self.prelude_types.append('|'.join([n for n in (m.datatypes + m.aliases) if not n.startswith('(')]) + '|')
+			self.constructors.extend('|'.join(c) + '|' for c in m.constructors)
+		self.includes.append(m.include_text())
+		self.module_texts.append(m.moduleText())
+
+	def print_all(self):
+		print('Prelude:')
+		print('show|')
+		for line in self.prelude_values:
+			print(line)
+
+		print('\n'*5)
+
+		print('Prelude Aliases and Datatypes:')
+		print('Int|Float|Char|Bool|String|True|False')
+		for line in self.prelude_types:
+			print(line)
+
+		print('\n'*5)
+
+		print('Includes:')
+		for line in self.includes:
+			print(line)
+
+		print('\n'*5)
+
+		print('Includes Continued:')
+		for line in self.module_texts:
+			print(line)
+
+		print('\n'*5)
+
+		print('Constructors:')
+		print('\(\)|\[\]|True|False|Int|Char|Bool|String|')
+		for line in self.constructors:
+			print(line)
+
+		print('\n'*5)
+
+
+PRELUDE = ['Basics', 'List', 'Signal', 'Text', 'Maybe', 'Time', 'Graphics.Element', 'Color', 'Graphics.Collage']
+
+MARKDOWN_SNIPPET = '<snippet>\n<content><![CDATA[\n[markdown|\n\n${1}\n\n|]\n\n\n]]></content>\n<!-- Optional: Set a tabTrigger to define how to trigger the snippet -->\n<tabTrigger>markdown</tabTrigger>\n<!-- Optional: Set a scope to limit where the snippet will trigger -->\n<scope>source.elm</scope>\n<description>A markdown block</description>\n</snippet>'
 
-if __name__ == '__main__':
-	## Usage: pass in docs.json from cabal's elm directory
-	path = sys.argv[1]
-	prelude = ['Basics', 'List', 'Signal', 'Text', 'Maybe', 'Time', 'Graphics.Element', 'Color', 'Graphics.Collage']
-
-	modules = [Module(m) for m in loadDocs(path)]
-
-	print('Prelude:')
-	print('show|')
-	for m in modules:
-		if m.name in prelude:
-			print('|'.join([n for n in m.valueNames if not n.startswith('(')]))
-
-	print('\n'*5)
-
-	print('Prelude Aliases and Datatypes:')
-	print('Int|Float|Char|Bool|String|True|False')
-	for m in modules:
-		if m.name in prelude:
-			print('|'.join([n for n in (m.datatypes + m.aliases) if not n.startswith('(')]) + '|')
-
-	print('\n'*5)
-
-	print('Includes:')
-	for m in modules:
-		print(m.include_text())
-
-	print('\n'*5)
-
-	print('Includes Continued:')
-	for m in modules:
-		print(m.moduleText())
-
-	print('\n'*5)
-
-	print('Constructors:')
-	print('\(\)|\[\]|True|False|Int|Char|Bool|String|')
-	for m in modules:
-		if m.name in prelude:
-			for c in m.constructors:
-				print('|'.join(c) + '|')
-
-	print('\n'*5)
-
-	print('Writing Autocompletion Snippets...:')
-	for m in modules:
-		if m.name in prelude:
-			m.snippets()
-			print('\n'*2)
 
-	with open('Snippets\\Basics\\markdown.sublime-snippet', 'w') as f:
-		f.write('<snippet>\n<content><![CDATA[\n[markdown|\n\n${1}\n\n|]\n\n\n]]></content>\n<!-- Optional: Set a tabTrigger to define how to trigger the snippet -->\n<tabTrigger>markdown</tabTrigger>\n<!-- Optional: Set a scope to limit where the snippet will trigger -->\n<scope>source.elm</scope>\n<description>A markdown block</description>\n</snippet>')
-	print('Wrote markdown.sublime-snippet')
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Generate the Elm module grammar and snippets from docs.json.')
+	parser.add_argument('docs', help="docs.json from cabal's elm directory")
+	parser.add_argument('--out', default='.', help='directory to write Syntaxes/ and Snippets/ under')
+	parser.add_argument('--print', dest='print_sections', action='store_true',
+		help='also print the prelude name lists and tmLanguage fragments')
+	args = parser.parse_args()
+
+	artifacts = Artifacts(args.out)
+	sections = Sections(PRELUDE) if args.print_sections else None
+	with SnippetWriter() as writer:
+		for data in iterDocs(args.docs):
+			artifacts.add(data, writer)
+			if sections:
+				sections.add(Module(data))
+	write_if_changed(os.path.join(args.out, 'Snippets', 'Basics', 'markdown.sublime-snippet'), MARKDOWN_SNIPPET)
+	removed = artifacts.finish()
+
+	if sections:
+		sections.print_all()
+	print('{} modules: {} regenerated, {} unchanged, {} removed; wrote {} snippets'.format(
+		len(artifacts.modules), artifacts.regenerated, len(artifacts.modules) - artifacts.regenerated,
+		len(removed), writer.written))
@@ -0,0 +1,218 @@
+import io
+import os
+import os.path as fs
+import re
+import threading
+
+try:     # ST3
+    from .elm_oracle import IMPORT_RE, IMPORT_PARTS_RE
+except:  # ST2
+    from elm_oracle import IMPORT_RE, IMPORT_PARTS_RE
+
+MAIN_RE = re.compile(r'^main\s*[:=]', re.MULTILINE)
+
+
+class ModuleGraph(object):
+    """
+    The import graph of the modules in a project's source directories.
+
+    Modules are named by their path below a source directory, which is how
+    the compiler finds them. Main modules are the ones defining a top-level
+    `main`, plus any configured as the project's main.
+
+    Every module keeps the set of modules it imports and the set that
+    import it, so direct dependents are a dictionary lookup. The main
+    modules each module reaches are worked out on first use and kept until
+    an update changes an edge, so repeated questions between saves cost a
+    dictionary lookup too.
+
+    Scanning a large project takes too long for the UI thread, so it runs
+    on a thread of its own and the graph is only queried once scanned.
+    """
+
+    def __init__(self, source_dirs, main_paths=()):
+        self.source_dirs = source_dirs
+        self.main_paths = frozenset(main_paths)
+        self.lock = threading.RLock()
+        self.paths = {}
+        self.names = {}
+        self.stamps = {}
+        self.imports = {}
+        self.file_imports = {}
+        self.importers = {}
+        self.mains = set()
+        self.affected = {}
+        self.scanned = False
+        self.scanning = False
+
+    def module_names(self, file_path):
+        """
+        Return every name `file_path` can be imported as.
+        """
+        names = []
+        for source_dir in self.source_dirs:
+            relative = fs.relpath(file_path, source_dir)
+            if not relative.startswith(os.pardir) and relative.endswith('.elm'):
+                names.append(relative[:-len('.elm')].replace(os.sep, '.'))
+        return names
+
+    def scan(self, file_paths):
+        """
+        Bring the graph in line with `file_paths`, reading only the files
+        that are new or changed since they were last read.
+        """
+        with self.lock:
+            removed = set(self.stamps) - set(file_paths)
+        for file_path in removed:
+            self.update(file_path)
+        for file_path in file_paths:
+            if self.stamps.get(file_path) != file_stamp(file_path):
+                self.update(file_path)
+        self.scanned = True
+
+    def scan_in_background(self, list_files):
+        """
+        Scan the files `list_files` returns on a new thread, unless a scan
+        is already running.
+        """
+        with self.lock:
+            if self.scanning:
+                return
+            self.scanning = True
+
+        def scan():
+            try:
+                self.scan(list_files())
+            finally:
+                self.scanning = False
+
+        thread = threading.Thread(target=scan)
+        thread.daemon = True
+        thread.start()
+
+    def update(self, file_path):
+        """
+        Read one file again, after it was saved, created or deleted.
+        Returns whether the graph changed.
+        """
+        stamp = file_stamp(file_path)
+        source = read_source(file_path) if stamp else None
+        names = self.module_names(file_path) if source is not None else []
+        imports = frozenset(parse_imported_modules(source)) if source is not None else frozenset()
+        is_main = file_path in self.main_paths or bool(source and MAIN_RE.search(source))
+        with self.lock:
+            old_names = self.names.get(file_path, [])
+            changed = (set(old_names) != set(names) or is_main != (file_path in self.mains) or
+                any(self.imports.get(name) != imports for name in names))
+            if stamp:
+                self.stamps[file_path] = stamp
+            else:
+                self.stamps.pop(file_path, None)
+            if not changed:
+                return False
+            for name in old_names:
+                self.remove(name, file_path)
+            if names:
+                self.names[file_path] = names
+                self.file_imports[file_path] = imports
+            else:
+                self.names.pop(file_path, None)
+                self.file_imports.pop(file_path, None)
+            for name in names:
+                self.add(name, file_path)
+            if is_main:
+                self.mains.add(file_path)
+            else:
+                self.mains.discard(file_path)
+            self.affected.clear()
+            return True
+
+    def add(self, name, file_path):
+        if name in self.paths:
+            self.remove(name, self.paths[name], replace=False)
+        self.paths[name] = file_path
+        self.imports[name] = self.file_imports[file_path]
+        for imported in self.imports[name]:
+            self.importers.setdefault(imported, set()).add(name)
+
+    def remove(self, name, file_path, replace=True):
+        # two files can claim a name, as while a module is being moved
+        # between source directories; the name stays with the last one
+        if self.paths.get(name) != file_path:
+            return
+        del self.paths[name]
+        for imported in self.imports.pop(name, ()):
+            importers = self.importers.get(imported)
+            if importers is not None:
+                importers.discard(name)
+                if not importers:
+                    del self.importers[imported]
+        if replace:
+            for other, other_names in self.names.items():
+                if other != file_path and name in other_names:
+                    self.add(name, other)
+                    break
+
+    def dependents(self, name):
+        """
+        Return the names of the modules that import `name` directly.
+        """
+        return self.importers.get(name, set())
+
+    def affected_mains(self, file_path):
+        """
+        Return the paths of the main modules that import `file_path`,
+        directly or not, including the file itself if it is a main module.
+        """
+        with self.lock:
+            names = self.module_names(file_path)
+            key = names[0] if names else file_path
+            if key not in self.affected:
+                seen = set(names)
+                stack = list(names)
+                while stack:
+                    for importer in self.importers.get(stack.pop(), ()):
+                        if importer not in seen:
+                            seen.add(importer)
+                            stack.append(importer)
+                reached = set(self.paths[name] for name in seen if name in self.paths)
+                self.affected[key] = frozenset(reached & self.mains)
+            return self.affected[key]
+
+
+GRAPHS = {}
+
+def project_graph(root, source_dirs, main_paths=()):
+    """
+    Return the module graph of a project, starting a new one if its source
+    directories or configured main modules have changed.
+    """
+    graph = GRAPHS.get(root)
+    if graph is None or graph.source_dirs != source_dirs or graph.main_paths != frozenset(main_paths):
+        graph = GRAPHS[root] = ModuleGraph(source_dirs, main_paths)
+    return graph
+
+def file_stamp(file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+def read_source(file_path):
+    try:
+        with io.open(file_path, encoding='utf-8', errors='replace') as elm_file:
+            return elm_file.read()
+    except (IOError, OSError):
+        return None
+
+def parse_imported_modules(source):
+    """
+    Return the names of the modules imported by Elm source.
+    """
+    names = []
+    for statement in IMPORT_RE.findall(source):
+        match = IMPORT_PARTS_RE.match(' '.join(statement.split()))
+        if match:
+            names.append(match.group(1))
+    return names
@@ -10,12 +10,14 @@ except:  # ST2
     from elm_project import ElmProject
 default_exec = import_module('Default.exec')
 
+BLANK_LINES_RE = re.compile(r'(\n)+')
+
 @replace_base_class('Highlight Build Errors.HighlightBuildErrors.ExecCommand')
 class ElmMakeCommand(default_exec.ExecCommand):
 
     # inspired by: http://www.sublimetext.com/forum/viewtopic.php?t=12028
     def run(self, error_format, info_format, syntax, color_scheme, null_device, warnings, **kwargs):
-        self.buffer = b''
+        self.buffer = []
         self.warnings = warnings == "true"
         self.error_format = string.Template(error_format)
         self.info_format = string.Template(info_format)
@@ -33,12 +35,23 @@ class ElmMakeCommand(default_exec.ExecCommand):
         else:
             # cmd[1] builds active file rather than project main
             cmd[2] = output_arg.format(null=null_device)
+            if project.exists and get_setting('elm_make_affected_mains', True):
+                # check the main modules the file affects instead, which
+                # compiles the file along with everything depending on it,
+                # once the module graph has been scanned in the background
+                graph = project.scanned_module_graph()
+                with timed('make.affected_mains'):
+                    mains = graph.affected_mains(fs.abspath(file_arg)) if graph else None
+                if mains:
+                    cmd[1:2] = sorted(fs.relpath(path, project.working_dir) for path in mains)
         project_dir = project.working_dir or working_dir
+        # exec builds its own environment, only the lookup is shared
+        cmd[0] = RUNNER.which(cmd[0])
         # ST2: TypeError: __init__() got an unexpected keyword argument 'syntax'
         super(ElmMakeCommand, self).run(cmd, working_dir=project_dir, **kwargs)
 
     def style_output(self, syntax, color_scheme):
-        self.output_view.set_syntax_file(syntax)
+        self.output_view.set_syntax_file(syntax_path(syntax))
         self.output_view.settings().set('color_scheme', color_scheme)
         if self.is_patched:
             self.debug_text = ''
@@ -46,25 +59,50 @@ class ElmMakeCommand(default_exec.ExecCommand):
             self.debug_text = get_string('make.missing_plugin')
 
     def on_data(self, proc, data):
-        self.buffer += data
+        # format every complete line as soon as it arrives and hold on to
+        # the chunks of the line that is still incomplete
+        self.buffer.append(data)
+        if b'\n' not in data:
+            return
+        result_bytes = b''.join(self.buffer).split(b'\n')
+        self.buffer = [result_bytes.pop()]
+        self.show_results(proc, result_bytes)
 
     def on_finished(self, proc):
-        result_strs = self.buffer.decode(self.encoding).split('\n')
-        flat_map = lambda f ,xss: sum(map(f, xss), [])
-        output_strs = flat_map(self.format_result, result_strs) + ['']
-        output_data = '\n'.join(output_strs).encode(self.encoding)
-        super(ElmMakeCommand, self).on_data(proc, output_data)
+        self.show_results(proc, [b''.join(self.buffer)])
+        self.buffer = []
         super(ElmMakeCommand, self).on_finished(proc)
 
-    def format_result(self, result_str):
-        decode_error = lambda dict: self.format_error(**dict) if 'type' in dict else dict
-        try:
-            data = json.loads(result_str, object_hook=decode_error)
-            return [s for s in data if s is not None]
-        except ValueError:
+    @timed('make.format')
+    def show_results(self, proc, result_bytes):
+        output_strs = []
+        invalid_strs = []
+        for result in result_bytes:
+            output_strs.extend(self.format_result(result.decode(self.encoding), invalid_strs))
+        if invalid_strs:
+            log_string('make.logging.invalid_json', '\n'.join(invalid_strs))
+        if output_strs:
+            output_strs.append('')
+            output_data = '\n'.join(output_strs).encode(self.encoding)
+            super(ElmMakeCommand, self).on_data(proc, output_data)
+
+    def format_result(self, result_str, invalid_strs=None):
+        info_str = result_str.strip()
+        # only reports can be JSON, don't bother parsing plain info lines
+        if info_str[:1] in ('[', '{'):
+            decode_error = lambda dict: self.format_error(**dict) if 'type' in dict else dict
+            try:
+                data = json.loads(info_str, object_hook=decode_error)
+                return [s for s in data if s is not None]
+            except ValueError:
+                pass
+        if not info_str:
+            return []
+        if invalid_strs is None:
             log_string('make.logging.invalid_json', result_str)
-            info_str = result_str.strip()
-            return [self.info_format.substitute(info=info_str)] if info_str else []
+        else:
+            invalid_strs.append(result_str)
+        return [self.info_format.substitute(info=info_str)]
 
     def format_error(shelf, type, file, region, overview, details, **kwargs):
         if type == 'warning' and not shelf.warnings:
@@ -73,7 +111,7 @@ class ElmMakeCommand(default_exec.ExecCommand):
         column = region['start']['column']
         message = overview
         if details:
-            message += '\n' + re.sub(r'(\n)+', r'\1', details)
+            message += '\n' + BLANK_LINES_RE.sub(r'\1', details)
         # TypeError: substitute() got multiple values for argument 'self'
         # https://bugs.python.org/issue23671
         return shelf.error_format.substitute(**locals())
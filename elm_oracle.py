@@ -0,0 +1,628 @@
+import bisect
+import hashlib
+import heapq
+import io
+import json
+import os
+import os.path as fs
+import re
+import threading
+import time
+
+try:     # ST3
+    from .elm_process import kill
+except:  # ST2
+    from elm_process import kill
+
+
+class OracleIndex(object):
+    """
+    An index over the oracle entries of a project, so lookups from the show
+    type and completion paths don't have to scan every entry.
+
+    Entries are hashed by their short name, by their full name, and by every
+    module prefix of their full name. Buckets are ranked once at build time:
+    the shortest full names come first, which is the order the old per-lookup
+    similarity sort produced for an unqualified query. Completions are
+    indexed per module, as a file only completes the modules it imports.
+    """
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.by_name = {}
+        self.by_full_name = {}
+        self.by_module = {}
+        modules = {}
+        for entry in sorted(entries, key=lambda v: len(v['fullName'])):
+            full_name = entry['fullName']
+            self.by_name.setdefault(entry['name'], []).append(entry)
+            self.by_full_name.setdefault(full_name, entry)
+            module = module_name(full_name)
+            modules.setdefault(module, []).append(entry)
+            parts = module.split('.')
+            for i in range(1, len(parts) + 1):
+                self.by_module.setdefault('.'.join(parts[:i]), []).append(entry)
+        self.completions = dict((module, CompletionIndex(module_entries))
+            for module, module_entries in modules.items())
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class FileOracle(object):
+    """
+    The entries of a project's index as one file sees them: only those of
+    the modules it imports, resolved through its aliases and exposing lists.
+    """
+
+    def __init__(self, project, imports=()):
+        self.project = project
+        self.imports = parse_imports(imports)
+        self.aliases = dict((alias, module) for module, (alias, exposed) in self.imports.items() if alias)
+
+    def imported(self, entry):
+        return module_name(entry['fullName']) in self.imports
+
+    def lookup(self, query):
+        """
+        Return the best entry for a possibly qualified name such as 'map',
+        'Dict.map' or 'D.map', or None if nothing by that name is imported.
+        """
+        name = query.split('.')[-1]
+        matches = [entry for entry in self.project.index.by_name.get(name, ()) if self.imported(entry)]
+        if not matches:
+            return None
+        qualifier = module_name(query)
+        if not qualifier:
+            # unqualified names refer to what the imports expose
+            for entry in matches:
+                if self.exposes(module_name(entry['fullName']), entry['name']):
+                    return entry
+        else:
+            module = self.aliases.get(qualifier, qualifier)
+            for entry in matches:
+                if module_name(entry['fullName']) == module:
+                    return entry
+            suffix = '.' + query
+            for entry in matches:
+                if entry['fullName'].endswith(suffix):
+                    return entry
+            # aliases the imports don't declare, as in an unsaved edit
+            for entry in matches:
+                if module_name(entry['fullName']).split('.')[-1].startswith(qualifier):
+                    return entry
+        return matches[0]
+
+    def exposes(self, module, name):
+        exposed = self.imports.get(module, (None, ()))[1]
+        return exposed is True or name in exposed
+
+    def in_module(self, module):
+        """
+        Return every imported entry whose module is `module` or nested
+        below it.
+        """
+        module = self.aliases.get(module, module)
+        return [entry for entry in self.project.index.by_module.get(module, ()) if self.imported(entry)]
+
+    def complete(self, prefix, limit=None):
+        """
+        Return the best ranked imported entries whose name or full name
+        starts with `prefix`.
+        """
+        completions = self.project.index.completions
+        matches = []
+        for module in self.imports:
+            if module in completions:
+                matches.extend(completions[module].complete(prefix, limit))
+        rank = lambda entry: CompletionIndex.rank(entry, prefix)
+        return heapq.nsmallest(limit or CompletionIndex.LIMIT, matches, key=rank)
+
+
+class CompletionIndex(object):
+    """
+    Sorted arrays of every name and every full name, searched with bisect,
+    and the entries listed in rank order under each one and two character
+    prefix of their names, both worked out once at build time.
+
+    A prefix with few matches has them ranked on the spot. A prefix with
+    many, like a single letter, walks its list in rank order and stops at
+    the limit, so either costs about the size of the result.
+    """
+
+    LIMIT = 200
+    BUCKET_LENGTH = 2
+
+    def __init__(self, entries):
+        self.entries = entries
+        # the shortest full names first, ties broken alphabetically
+        self.order = sorted(range(len(entries)), key=lambda i: (len(entries[i]['fullName']), entries[i]['fullName']))
+        self.ranks = [0] * len(entries)
+        for rank, i in enumerate(self.order):
+            self.ranks[i] = rank
+        names = sorted((v['name'], i) for i, v in enumerate(entries))
+        self.names = [key for key, i in names]
+        self.name_ids = [i for key, i in names]
+        full_names = sorted((v['fullName'], i) for i, v in enumerate(entries))
+        self.full_names = [key for key, i in full_names]
+        self.full_name_ids = [i for key, i in full_names]
+        self.by_name_prefix = {}
+        self.by_full_name_prefix = {}
+        for i in self.order:
+            for length in range(1, self.BUCKET_LENGTH + 1):
+                name = entries[i]['name']
+                full_name = entries[i]['fullName']
+                if len(name) >= length:
+                    self.by_name_prefix.setdefault(name[:length], []).append(i)
+                if len(full_name) >= length:
+                    self.by_full_name_prefix.setdefault(full_name[:length], []).append(i)
+
+    def complete(self, prefix, limit=None):
+        """
+        Return the entries whose name or full name starts with `prefix`:
+        exact names first, then matches on the name, then on the full name,
+        each by rank.
+        """
+        limit = limit or self.LIMIT
+        name_lo, name_hi = span(self.names, prefix)
+        full_lo, full_hi = span(self.full_names, prefix)
+        if (name_hi - name_lo) + (full_hi - full_lo) <= 2 * limit:
+            ids = set(self.name_ids[name_lo:name_hi]) | set(self.full_name_ids[full_lo:full_hi])
+            rank = lambda i: (self.entries[i]['name'] != prefix, not self.entries[i]['name'].startswith(prefix),
+                self.ranks[i])
+            return [self.entries[i] for i in sorted(ids, key=rank)[:limit]]
+        exact_hi = bisect.bisect_right(self.names, prefix, name_lo, name_hi)
+        found = sorted(self.name_ids[name_lo:exact_hi], key=self.ranks.__getitem__)[:limit]
+        bucket = prefix[:self.BUCKET_LENGTH]
+        for i in self.by_name_prefix.get(bucket, ()) if bucket else self.order:
+            if len(found) >= limit:
+                break
+            name = self.entries[i]['name']
+            if name != prefix and name.startswith(prefix):
+                found.append(i)
+        for i in self.by_full_name_prefix.get(bucket, ()) if bucket else ():
+            if len(found) >= limit:
+                break
+            if self.entries[i]['fullName'].startswith(prefix) and not self.entries[i]['name'].startswith(prefix):
+                found.append(i)
+        return [self.entries[i] for i in found]
+
+    @staticmethod
+    def rank(entry, prefix):
+        # exact names first, then matches on the short name, then the shortest
+        return (entry['name'] != prefix, not entry['name'].startswith(prefix),
+            len(entry['fullName']), entry['fullName'])
+
+
+def span(keys, prefix):
+    """
+    Return the range of the sorted `keys` that start with `prefix`.
+    """
+    lo = bisect.bisect_left(keys, prefix)
+    return lo, bisect.bisect_left(keys, prefix + u'\uffff', lo)
+
+
+class ProjectOracle(object):
+    """
+    The oracle data of one project: a single OracleIndex over the entries of
+    every module its files import, which each file sees through the aliases
+    and exposing lists of its own imports.
+
+    Oracle output only adds the entries of modules the index doesn't hold
+    yet, so in a project whose files import the same packages the index is
+    built once, and a file importing nothing new needs no oracle run at all.
+
+    The background loader's workers share it, so it is only read and
+    changed under its lock.
+    """
+
+    def __init__(self, root, dependencies=None):
+        self.root = root
+        self.dependencies = dependencies
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.loaded = set()
+        self.all_loaded = False
+        self.index = None
+
+    def reuse(self, imports):
+        """
+        Return a view of the index for a file with these imports, if the
+        entries of every module they import are already loaded.
+        """
+        if imports is None:
+            return None
+        view = FileOracle(self, imports)
+        with self.lock:
+            if self.index is None or not (self.all_loaded or self.loaded.issuperset(view.imports)):
+                return None
+        return view
+
+    def add(self, imports, entries, all_modules=False):
+        """
+        Record the oracle output for a file with the given imports, or the
+        entries of every module of the dependencies, and return the view of
+        the index the file should be looked up in.
+        """
+        view = FileOracle(self, imports)
+        with self.lock:
+            # a type and its constructor can share a full name
+            new = [entry for entry in entries if (entry['fullName'], entry['signature']) not in self.entries]
+            for entry in new:
+                self.entries[(entry['fullName'], entry['signature'])] = entry
+            self.loaded.update(view.imports)
+            self.all_loaded = self.all_loaded or all_modules
+            if not new and self.index is not None:
+                return view
+            entries = list(self.entries.values())
+        # indexing is the slow part, and touches nothing shared
+        index = OracleIndex(entries)
+        with self.lock:
+            # of two workers indexing at once, the later one read more
+            if self.index is None or len(index) >= len(self.index):
+                self.index = index
+        return view
+
+
+class DiskCache(object):
+    """
+    Oracle output stored as compact JSON files under a cache directory, so a
+    restarted editor doesn't have to run elm oracle again. Entries are keyed
+    by content hashes, so stale ones are never read; they are evicted, least
+    recently used first, once the directory grows past `max_size` bytes.
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+
+    @staticmethod
+    def key(dependencies, imports):
+        return hash_strings([dependencies] + list(imports))
+
+    def get(self, key):
+        file_path = fs.join(self.path, key + '.json')
+        try:
+            with io.open(file_path, 'rb') as cache_file:
+                data = json.loads(cache_file.read().decode('utf-8'))
+            os.utime(file_path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        return data
+
+    def put(self, key, entries):
+        file_path = fs.join(self.path, key + '.json')
+        temp_path = file_path + '.tmp'
+        try:
+            if not fs.isdir(self.path):
+                os.makedirs(self.path)
+            with io.open(temp_path, 'wb') as cache_file:
+                cache_file.write(json.dumps(entries, separators=(',', ':')).encode('utf-8'))
+            if os.name == 'nt' and fs.exists(file_path):
+                os.remove(file_path)
+            os.rename(temp_path, file_path)
+        except (IOError, OSError):
+            return
+        self.evict()
+
+    def evict(self):
+        try:
+            names = [name for name in os.listdir(self.path) if name.endswith('.json')]
+            stats = [(os.stat(fs.join(self.path, name)), name) for name in names]
+        except OSError:
+            return
+        total = sum(stat.st_size for stat, name in stats)
+        for stat, name in sorted(stats, key=lambda pair: pair[0].st_mtime):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(fs.join(self.path, name))
+            except OSError:
+                continue
+            total -= stat.st_size
+
+
+class LoadTask(object):
+    """
+    A single background load. Cancelling it kills the process it is waiting
+    on, and a process attached after cancelling is killed straight away.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.cancelled = False
+        self.process = None
+        self.lock = threading.Lock()
+
+    def attach(self, process):
+        with self.lock:
+            self.process = process
+            if self.cancelled:
+                kill(process)
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.process is not None:
+                kill(self.process)
+
+
+class BackgroundLoader(object):
+    """
+    A work queue running `load(filename, task)` on a small pool of worker
+    threads.
+
+    A request waits `delay` seconds before it runs, and every new request in
+    the same project restarts that wait, so bursts of events settle first.
+    Repeated requests for a queued file are merged. A request for a file that
+    is already loading is dropped, unless the file changed since, which
+    cancels the stale load. Callbacks registered with
+    `when_loaded` run once the latest load of their file has finished.
+    """
+
+    def __init__(self, load, workers=2, delay=0.25):
+        self.load = load
+        self.workers = workers
+        self.delay = delay
+        self.condition = threading.Condition()
+        self.pending = {}
+        self.running = {}
+        self.waiting = {}
+        self.threads = []
+
+    def request(self, filename, project, stale=False):
+        with self.condition:
+            if filename in self.running and not stale:
+                return
+            due = time.time() + self.delay
+            for other, (other_project, other_due) in list(self.pending.items()):
+                if other_project == project:
+                    self.pending[other] = (other_project, due)
+            self.pending[filename] = (project, due)
+            if filename in self.running:
+                self.running[filename].cancel()
+            if len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.work)
+                thread.daemon = True
+                self.threads.append(thread)
+                thread.start()
+            self.condition.notify_all()
+
+    def when_loaded(self, filename, callback, key=None):
+        """
+        Call `callback()` once, after the load of `filename` that is queued or
+        running now has finished. A later callback with the same `key`
+        replaces an earlier one. Returns False if no load is in progress.
+        """
+        with self.condition:
+            if filename not in self.pending and filename not in self.running:
+                return False
+            self.waiting.setdefault(filename, {})[key or callback] = callback
+            return True
+
+    def work(self):
+        while True:
+            task = self.next_task()
+            callbacks = {}
+            try:
+                self.load(task.filename, task)
+            except Exception:
+                import traceback
+                traceback.print_exc()
+            finally:
+                with self.condition:
+                    if self.running.get(task.filename) is task:
+                        del self.running[task.filename]
+                        if task.filename not in self.pending:
+                            callbacks = self.waiting.pop(task.filename, {})
+                    self.condition.notify_all()
+            for callback in callbacks.values():
+                callback()
+
+    def next_task(self):
+        with self.condition:
+            while True:
+                now = time.time()
+                ready = [(due, filename) for filename, (project, due) in self.pending.items()
+                    if due <= now and filename not in self.running]
+                if ready:
+                    filename = min(ready)[1]
+                    del self.pending[filename]
+                    task = self.running[filename] = LoadTask(filename)
+                    return task
+                dues = [due for project, due in self.pending.values()]
+                self.condition.wait(max(min(dues) - now, 0.01) if dues else None)
+
+
+PROJECTS = {}
+PROJECTS_LOCK = threading.Lock()
+
+def project_oracle(root, dependencies=None):
+    """
+    Return the oracle data of a project, dropping it first if the project's
+    dependencies have changed since it was loaded.
+    """
+    with PROJECTS_LOCK:
+        if root not in PROJECTS or PROJECTS[root].dependencies != dependencies:
+            PROJECTS[root] = ProjectOracle(root, dependencies)
+        return PROJECTS[root]
+
+def dependencies_key(working_dir):
+    """
+    Return a hash of the files that decide which packages elm oracle reads
+    documentation from.
+    """
+    contents = []
+    for file_path in ('elm-package.json', fs.join('elm-stuff', 'exact-dependencies.json')):
+        try:
+            with io.open(fs.join(working_dir, file_path), 'rb') as json_file:
+                contents.append(json_file.read())
+        except (IOError, OSError):
+            contents.append(b'')
+    return hash_strings([working_dir.encode('utf-8')] + contents)
+
+def hash_strings(strings):
+    digest = hashlib.sha1()
+    for string in strings:
+        digest.update(string if isinstance(string, bytes) else string.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+IMPORT_RE = re.compile(r'^import\s[^\n]*(?:\n[ \t]+[^\n]*)*', re.MULTILINE)
+
+def read_imports(file_path):
+    """
+    Return the normalized import statements of an Elm file, which is all the
+    oracle output for that file depends on, or None if it can't be read.
+    """
+    try:
+        with io.open(file_path, encoding='utf-8', errors='replace') as elm_file:
+            text = elm_file.read()
+    except (IOError, OSError, TypeError):
+        return None
+    return tuple(' '.join(statement.split()) for statement in IMPORT_RE.findall(text))
+
+# what every Elm module imports implicitly, in 0.16 and 0.17
+DEFAULT_IMPORTS = (
+    'import Basics exposing (..)',
+    'import Debug',
+    'import List exposing (List, (::))',
+    'import Maybe exposing (Maybe(Just, Nothing))',
+    'import Result exposing (Result(Ok, Err))',
+    'import Signal exposing (Signal)',
+    'import Platform exposing (Program)',
+    'import Platform.Cmd as Cmd exposing (Cmd, (!))',
+    'import Platform.Sub as Sub exposing (Sub)',
+)
+IMPORT_PARTS_RE = re.compile(r'^import\s+([\w.]+)(?:\s+as\s+([\w.]+))?(?:\s+exposing\s*\((.*)\))?')
+
+def parse_imports(imports):
+    """
+    Return a dictionary from each module imported by the given normalized
+    import statements, and the default imports, to its alias and what it
+    exposes: True for `exposing (..)`, otherwise a set of names.
+
+    A module imported more than once, as an explicit import of a default
+    one, exposes the names of all its imports and keeps any alias.
+    """
+    modules = {}
+    for statement in DEFAULT_IMPORTS + tuple(imports or ()):
+        match = IMPORT_PARTS_RE.match(statement)
+        if match:
+            module, alias, exposing = match.groups()
+            exposed = exposed_names(exposing)
+            if module in modules:
+                old_alias, old_exposed = modules[module]
+                alias = alias or old_alias
+                exposed = True if exposed is True or old_exposed is True else exposed | old_exposed
+            modules[module] = (alias, exposed)
+    return modules
+
+def exposed_names(exposing):
+    if exposing is None:
+        return set()
+    if exposing.strip() == '..':
+        return True
+    names = set()
+    depth = 0
+    item = ''
+    for char in exposing + ',':
+        if char == ',' and depth == 0:
+            item = item.strip()
+            if item.startswith('('):
+                names.add(item.strip('() '))
+            elif item:
+                type_name, paren, constructors = item.partition('(')
+                names.add(type_name.strip())
+                # the constructors of `Type(..)` aren't known here
+                names.update(name.strip() for name in constructors.rstrip(')').split(',')
+                    if name.strip() not in ('', '..'))
+            item = ''
+            continue
+        depth += {'(': 1, ')': -1}.get(char, 0)
+        item += char
+    return names
+
+DOCS = {}
+PACKAGE_URL = 'http://package.elm-lang.org/packages/{0}/{1}/{2}#'
+
+def package_docs(working_dir):
+    """
+    Return a dictionary from the name of every module of the project's
+    installed dependencies to its package, version and documentation, or
+    None if the dependencies aren't installed. Each documentation.json is
+    parsed once, until it changes.
+    """
+    stuff = fs.join(working_dir, 'elm-stuff')
+    try:
+        with io.open(fs.join(stuff, 'exact-dependencies.json'), 'rb') as json_file:
+            dependencies = json.loads(json_file.read().decode('utf-8'))
+    except (IOError, OSError, ValueError):
+        return None
+    modules = {}
+    for package, version in sorted(dependencies.items()):
+        docs_path = fs.join(stuff, 'packages', package, version, 'documentation.json')
+        try:
+            stat = os.stat(docs_path)
+            stamp = (stat.st_mtime, stat.st_size)
+            if docs_path not in DOCS or DOCS[docs_path][0] != stamp:
+                with io.open(docs_path, 'rb') as json_file:
+                    DOCS[docs_path] = (stamp, json.loads(json_file.read().decode('utf-8')))
+        except (IOError, OSError, ValueError):
+            return None
+        for module in DOCS[docs_path][1]:
+            modules[module['name']] = (package, version, module)
+    return modules
+
+def read_entries(working_dir, imports=None):
+    """
+    Return the entries elm oracle would output for a file with the given
+    imports, or for every module of the dependencies without them, read
+    straight from the documentation.json files of the project's
+    dependencies, or None if those aren't installed.
+    """
+    modules = package_docs(working_dir)
+    if modules is None:
+        return None
+    entries = []
+    for module in sorted(modules if imports is None else parse_imports(imports)):
+        if module not in modules:
+            continue
+        package, version, doc = modules[module]
+        href = PACKAGE_URL.format(package, version, module.replace('.', '-'))
+        for name, signature, comment in module_values(doc):
+            entries.append({'name': name, 'fullName': module + '.' + name, 'href': href + name,
+                'signature': signature, 'comment': comment})
+    return entries
+
+def module_values(doc):
+    """
+    Yield the name, signature and comment of every alias, type, constructor
+    and value documented in a module.
+    """
+    for alias in doc.get('aliases', []):
+        yield alias['name'], alias.get('type', ''), alias.get('comment', '')
+    for union in doc.get('types', []):
+        result = ' '.join([union['name']] + union.get('args', []))
+        cases = union.get('cases', [])
+        comment = union.get('comment', '')
+        variants = ' | '.join(' '.join([case] + [wrap(arg) for arg in args]) for case, args in cases)
+        yield union['name'], variants, comment
+        for case, args in cases:
+            yield case, ' -> '.join([wrap(arg, '->') for arg in args] + [result]), comment
+    for value in doc.get('values', []):
+        yield value['name'], value.get('type', ''), value.get('comment', '')
+
+def wrap(type_str, separator=' '):
+    """
+    Parenthesize a type containing `separator` so it reads as one argument.
+    """
+    if separator in type_str and type_str[:1] not in ('(', '{'):
+        return '(' + type_str + ')'
+    return type_str
+
+def module_name(full_name):
+    """
+    Return the module part of a qualified name, or '' if it isn't qualified.
+    """
+    return full_name.rpartition('.')[0]
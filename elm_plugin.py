@@ -1,19 +1,71 @@
 import sublime
 import sublime_plugin
+import collections
+import functools
+import os
 import os.path as fs
+import shutil
+import subprocess
+import threading
+import time
+
+try:     # ST3
+    from .elm_process import kill
+except:  # ST2
+    from elm_process import kill
 
 def is_ST2():
     return sublime.version().startswith('2')
 
+SYNTAXES_DIR = 'Packages/Elm Language Support/Syntaxes/'
+SUBLIME_SYNTAXES = ('Elm', 'Elm Documentation', 'Elm Compile Messages')
+
+def syntax_path(path):
+    # sublime-syntax grammars tokenize faster, prefer them from build 3084 on
+    # for the grammars of this package that have one
+    if is_ST2() or int(sublime.version() or 0) < 3084:
+        return path
+    name = fs.splitext(path[len(SYNTAXES_DIR):])[0]
+    if not path.startswith(SYNTAXES_DIR) or name not in SUBLIME_SYNTAXES:
+        return path
+    return SYNTAXES_DIR + name + '.sublime-syntax'
+
+class SettingsSnapshot(object):
+    """
+    Values read from a settings file, kept until the file changes, so they
+    can be read often and from any thread. Only the first read of a key
+    touches the settings API.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.settings = None
+        self.values = {}
+
+    def get(self, key, default=None):
+        try:
+            value = self.values[key]
+        except KeyError:
+            if self.settings is None:
+                # ST2: RuntimeError: Must call on main thread
+                self.settings = sublime.load_settings(self.name)
+                self.settings.add_on_change('elm_plugin.snapshot', self.values.clear)
+            value = self.values[key] = self.settings.get(key)
+        return default if value is None else value
+
+SETTINGS = SettingsSnapshot('Elm Language Support.sublime-settings')
+STRINGS = SettingsSnapshot('Elm User Strings.sublime-settings')
+
+def get_setting(key, default=None):
+    return SETTINGS.get(key, default)
+
 def get_string(key, *args):
-    strings = sublime.load_settings('Elm User Strings.sublime-settings')
-    return strings.get('logging.prefix') + strings.get(key).format(*args)
+    return STRINGS.get('logging.prefix', '') + STRINGS.get(key).format(*args)
 
 def log_string(key, *args):
     def log_string_with_retry(retry):
         try:
-            # ST2: RuntimeError: Must call on main thread
-            settings = sublime.load_settings('Elm Language Support.sublime-settings')
+            debug = SETTINGS.get('debug')
         except RuntimeError:
             if retry:
                 sublime.set_timeout(lambda: log_string_with_retry(False), 0)
@@ -21,11 +73,223 @@ def log_string(key, *args):
                 import traceback
                 traceback.print_exc()
         else:
-            if settings.get('debug'):
+            if debug:
                 print(get_string(key, *args))
 
     log_string_with_retry(True)
 
+class Stats(object):
+    """
+    Rolling latency samples per operation and counters, such as cache hits
+    and misses, for finding out where the plugin spends its time.
+    """
+
+    SAMPLES = 1000
+    # upper bounds of the histogram buckets, in milliseconds
+    BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.counters = {}
+
+    def record(self, name, seconds):
+        with self.lock:
+            if name not in self.timings:
+                self.timings[name] = collections.deque(maxlen=self.SAMPLES)
+            self.timings[name].append(seconds * 1000)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def summary(self):
+        with self.lock:
+            timings = dict((name, sorted(samples)) for name, samples in self.timings.items())
+            counters = dict(self.counters)
+        summary = {'timings': {}, 'counters': counters}
+        for name, samples in timings.items():
+            percentile = lambda p: samples[min(int(len(samples) * p), len(samples) - 1)]
+            histogram = [0] * (len(self.BUCKETS) + 1)
+            for sample in samples:
+                histogram[len([bound for bound in self.BUCKETS if bound < sample])] += 1
+            summary['timings'][name] = {
+                'count': len(samples),
+                'mean': sum(samples) / len(samples),
+                'p50': percentile(0.5),
+                'p90': percentile(0.9),
+                'p99': percentile(0.99),
+                'max': samples[-1],
+                'histogram': histogram,
+            }
+        return summary
+
+    def reset(self):
+        with self.lock:
+            self.timings.clear()
+            self.counters.clear()
+
+STATS = Stats()
+
+class timed(object):
+    """
+    Record how long a block or a function takes under `name`, as either
+
+        with timed('oracle.spawn'):
+            ...
+
+    or
+
+        @timed('make.format')
+        def format_result(...):
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        STATS.record(self.name, time.time() - self.start)
+
+    def __call__(self, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                STATS.record(self.name, time.time() - start)
+        return wrapper
+
+def count(name, amount=1):
+    STATS.count(name, amount)
+
+ProcessResult = collections.namedtuple('ProcessResult', 'returncode output errors timed_out')
+
+class ProcessRunner(object):
+    """
+    Runs the Elm tools for every part of the plugin. Each process gets its
+    own environment and working directory instead of the plugin changing
+    os.environ or the current directory, so tools can run side by side.
+
+    Executables are looked up once per `elm_paths` value, at most
+    `elm_max_processes` run at a time, and a process is killed once it
+    runs past `elm_process_timeout` seconds or its task is cancelled.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.running = 0
+        self.paths = {}
+        self.executables = {}
+
+    def search_path(self):
+        """
+        Return PATH with the `elm_paths` setting in front of it.
+        """
+        elm_paths = get_setting('elm_paths', '')
+        key = (elm_paths, os.environ.get('PATH', ''))
+        if key not in self.paths:
+            path = os.path.expandvars(elm_paths + os.pathsep + '$PATH') if elm_paths else key[1]
+            self.paths = {key: path}
+        return self.paths[key]
+
+    def environment(self):
+        env = dict(os.environ)
+        env['PATH'] = self.search_path()
+        return env
+
+    def which(self, name):
+        """
+        Return the full path of an executable on the search path, or `name`
+        if it isn't found, to let the shell report it. Only found paths are
+        cached, so a tool installed later is picked up.
+        """
+        path = self.search_path()
+        key = (name, path)
+        with self.condition:
+            if key in self.executables:
+                return self.executables[key]
+        if hasattr(shutil, 'which'):
+            found = shutil.which(name, path=path) or name
+        else: # ST2
+            found = find_executable(name, path)
+        if found != name:
+            with self.condition:
+                self.executables[key] = found
+        return found
+
+    def run(self, args, input=None, cwd=None, timeout=None, task=None):
+        """
+        Run `args` with the first one looked up on the search path and
+        return a ProcessResult. `task` is anything with a `cancelled` flag
+        and an `attach(process)` method, such as elm_oracle.LoadTask.
+        """
+        if timeout is None:
+            timeout = get_setting('elm_process_timeout', 30)
+        self.acquire(task)
+        try:
+            if task is not None and task.cancelled:
+                return ProcessResult(None, b'', b'', False)
+            # Hide the console window on Windows
+            process = subprocess.Popen([self.which(args[0])] + list(args[1:]),
+                stdin=subprocess.PIPE if input is not None else None,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                cwd=cwd or None, env=self.environment(), shell=os.name == 'nt')
+            if task is not None:
+                task.attach(process)
+            timer = None
+            timed_out = []
+            if timeout:
+                timer = threading.Timer(timeout, self.expire, (process, timed_out))
+                timer.daemon = True
+                timer.start()
+            try:
+                output, errors = process.communicate(input)
+            finally:
+                if timer is not None:
+                    timer.cancel()
+            if timed_out:
+                count('process.timed_out')
+            return ProcessResult(process.returncode, output, errors, bool(timed_out))
+        finally:
+            self.release()
+
+    def expire(self, process, timed_out):
+        timed_out.append(True)
+        kill(process)
+
+    def acquire(self, task):
+        with self.condition:
+            while self.running >= max(get_setting('elm_max_processes', 4), 1):
+                if task is not None and task.cancelled:
+                    break
+                self.condition.wait(0.1)
+            self.running += 1
+
+    def release(self):
+        with self.condition:
+            self.running -= 1
+            self.condition.notify()
+
+def find_executable(name, path):
+    # on Windows only names with an extension from PATHEXT run, npm puts an
+    # extensionless sh script next to the .cmd of every tool
+    extensions = ['']
+    if os.name == 'nt' and not fs.splitext(name)[1]:
+        extensions = os.environ.get('PATHEXT', '.EXE;.BAT;.CMD').split(';')
+    for directory in path.split(os.pathsep):
+        for extension in extensions:
+            candidate = fs.join(directory, name + extension)
+            if fs.isfile(candidate) and os.access(candidate, os.X_OK):
+                return candidate
+    return name
+
+RUNNER = ProcessRunner()
+
 def import_module(path):
     names = path.split('.')
     index = 1 if is_ST2() else 0
@@ -0,0 +1,7 @@
+# process helpers shared by elm_plugin and elm_oracle, which imports no sublime
+
+def kill(process):
+    try:
+        process.kill()
+    except OSError: # already exited
+        pass
@@ -1,10 +1,18 @@
 import collections
+import contextlib
+import copy
 import json
+import os
+import shutil
+import tempfile
+import time
 
 try:     # ST3
     from .elm_plugin import *
+    from .elm_graph import GRAPHS, project_graph
 except:  # ST2
     from elm_plugin import *
+    from elm_graph import GRAPHS, project_graph
 
 class ElmProjectCommand(sublime_plugin.TextCommand):
 
@@ -41,11 +49,33 @@ class ElmProjectCommand(sublime_plugin.TextCommand):
             self.on_finished(self.norm_choices[index])
 
     def on_finished(self, value):
-        setattr(self.project, self.prop_name, value)
+        with self.project.batch():
+            setattr(self.project, self.prop_name, value)
         keys = self.project._last_updated_key_path
         if keys:
             sublime.status_message(get_string('project.updated', '.'.join(keys), value))
 
+def replace_file(src_path, dst_path):
+    try:
+        os.replace(src_path, dst_path)
+    except AttributeError: # ST2: no os.replace
+        if os.name == 'nt' and fs.exists(dst_path):
+            os.remove(dst_path)
+        os.rename(src_path, dst_path)
+
+class ElmProjectListener(sublime_plugin.EventListener):
+
+    def on_post_save(self, view):
+        file_path = view.file_name() or ''
+        # a new elm-package.json changes the project of every file below it
+        if fs.basename(file_path) == 'elm-package.json':
+            ElmProject.forget_json_paths()
+        elif file_path.endswith('.elm'):
+            # keep an existing module graph current, one file at a time
+            graph = GRAPHS.get(ElmProject(file_path).working_dir)
+            if graph is not None:
+                graph.update(file_path)
+
 BUILD_KEY = ('sublime-build',)
 MAIN_KEY = BUILD_KEY + ('main',)
 HTML_KEY = BUILD_KEY + ('html',)
@@ -55,25 +85,63 @@ OUTPUT_COMP_KEY = OUTPUT_KEY + ('components',)
 OUTPUT_DIR_KEY = OUTPUT_COMP_KEY + ('dir',)
 OUTPUT_NAME_KEY = OUTPUT_COMP_KEY + ('name',)
 OUTPUT_EXT_KEY = OUTPUT_COMP_KEY + ('ext',)
+SOURCE_DIRS_KEY = ('source-directories',)
 
 class ElmProject(object):
 
+    # process-wide caches shared by every instance:
+    # directory -> elm-package.json path (or None) found from it
+    _json_paths = {}
+    # directory -> when no elm-package.json was found from it; misses are
+    # looked up again after a while, as elm-package.json can be created
+    # outside the editor, by `elm package install` for one
+    _json_misses = {}
+    JSON_MISS_SECONDS = 5
+    # elm-package.json path -> ((mtime, size), parsed data)
+    _json_data = {}
+
     @classmethod
+    @timed('project.find_json')
     def find_json(cls, dir_path):
-        if not fs.isdir(fs.abspath(dir_path)):
+        # walk up to the first directory with elm-package.json or with a
+        # cached result, then cache the answer for every directory visited
+        dir_path = fs.abspath(dir_path)
+        now = time.time()
+        cached = lambda path: path in cls._json_paths and (cls._json_paths[path] is not None or
+            now - cls._json_misses.get(path, 0) < cls.JSON_MISS_SECONDS)
+        if not cached(dir_path) and not fs.isdir(dir_path):
             return None
-        file_path = fs.abspath(fs.join(dir_path, 'elm-package.json'))
-        if fs.isfile(file_path):
-            return file_path
-        parent_path = fs.join(dir_path, fs.pardir)
-        if fs.abspath(parent_path) == fs.abspath(dir_path):
-            return None
-        return cls.find_json(parent_path)
+        visited = []
+        while not cached(dir_path):
+            visited.append(dir_path)
+            file_path = fs.join(dir_path, 'elm-package.json')
+            if fs.isfile(file_path):
+                json_path = file_path
+                break
+            parent_path = fs.dirname(dir_path)
+            if parent_path == dir_path:
+                json_path = None
+                break
+            dir_path = parent_path
+        else:
+            json_path = cls._json_paths[dir_path]
+        for visited_path in visited:
+            cls._json_paths[visited_path] = json_path
+            if json_path is None:
+                cls._json_misses[visited_path] = now
+        return json_path
+
+    @classmethod
+    def forget_json_paths(cls):
+        cls._json_paths.clear()
+        cls._json_misses.clear()
 
     def __init__(self, file_path):
         self.file_path = file_path
         self.json_path = self.find_json(fs.dirname(file_path or ''))
         self.data_dict = self.load_json()
+        self._batch_depth = 0
+        self._owns_data = False
 
     def __getitem__(self, keys):
         if not self.exists:
@@ -90,11 +158,17 @@ class ElmProject(object):
         if not self.exists:
             sublime.error_message(get_string('project.not_found'))
             return
+        if not self._owns_data:
+            # the parsed data is shared through the cache, so change a copy
+            # that replaces it there only once it has been saved
+            self.data_dict = copy.deepcopy(self.data_dict)
+            self._owns_data = True
         item = self.data_dict
         for key in keys[0:-1]:
             item = item.setdefault(key, {})
         item[keys[-1]] = value
-        self.save_json()
+        if not self._batch_depth:
+            self.save_json()
         self._last_updated_key_path = keys
 
     def __repr__(self):
@@ -105,6 +179,32 @@ class ElmProject(object):
         return "{0}(\n{1}\n)".format(self.__class__.__name__, '\n'.join(properties))
 
     def load_json(self):
+        # parse elm-package.json again only if it has changed on disk
+        stamp = self.json_stamp()
+        if self.json_path and not stamp:
+            # elm-package.json was deleted, so cached lookups are stale
+            self.forget_json_paths()
+            self.json_path = self.find_json(fs.dirname(self.file_path or ''))
+            stamp = self.json_stamp()
+        cached = self._json_data.get(self.json_path)
+        if cached and cached[0] == stamp:
+            count('project.json_cache.hit')
+            return cached[1]
+        count('project.json_cache.miss')
+        with timed('project.parse_json'):
+            data_dict = self.parse_json()
+        if stamp:
+            self._json_data[self.json_path] = (stamp, data_dict)
+        return data_dict
+
+    def json_stamp(self):
+        try:
+            stat = os.stat(self.json_path)
+        except (TypeError, OSError): # self.json_path == None
+            return None
+        return (stat.st_mtime, stat.st_size)
+
+    def parse_json(self):
         try:
             with open(self.json_path) as json_file:
                 if is_ST2(): # AttributeError: 'module' object has no attribute 'OrderedDict'
@@ -117,12 +217,44 @@ class ElmProject(object):
             log_string('project.logging.invalid_json', self.json_path)
         return None
 
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Save the updates made inside the block with a single write.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+        if not self._batch_depth and self.exists:
+            self.save_json()
+
     def save_json(self):
-        with open(self.json_path, 'w') as json_file:
-            json.dump(self.data_dict, json_file,
-                indent=4,
-                separators=(',', ': '),
-                sort_keys=is_ST2())
+        json_str = json.dumps(self.data_dict,
+            indent=4,
+            separators=(',', ': '),
+            sort_keys=is_ST2())
+        try:
+            with open(self.json_path) as json_file:
+                unchanged = json_file.read() == json_str
+        except (IOError, OSError):
+            unchanged = False
+        if not unchanged:
+            # write a temporary file next to it and swap it in, so a crash
+            # can never leave elm-package.json half written
+            fd, temp_path = tempfile.mkstemp(prefix='.elm-package.', suffix='.tmp',
+                dir=fs.dirname(self.json_path))
+            try:
+                with os.fdopen(fd, 'w') as json_file:
+                    json_file.write(json_str)
+                shutil.copymode(self.json_path, temp_path)
+                replace_file(temp_path, self.json_path)
+            except:
+                os.remove(temp_path)
+                raise
+        self._json_data[self.json_path] = (self.json_stamp(), self.data_dict)
+        self._owns_data = False
 
     @property
     def exists(self):
@@ -132,6 +264,42 @@ class ElmProject(object):
     def working_dir(self):
         return fs.dirname(self.json_path or '')
 
+    @property
+    def source_dirs(self):
+        return [fs.normpath(fs.join(self.working_dir, source_dir))
+            for source_dir in self[SOURCE_DIRS_KEY] or ['.']]
+
+    def elm_files(self):
+        elm_files = []
+        for source_dir in self.source_dirs:
+            for dir_path, dir_names, file_names in os.walk(source_dir):
+                dir_names[:] = [name for name in dir_names if name != 'elm-stuff']
+                elm_files.extend(fs.join(dir_path, name) for name in file_names if name.endswith('.elm'))
+        return sorted(set(elm_files))
+
+    @timed('project.module_graph')
+    def module_graph(self):
+        """
+        Return the import graph of the project's modules, reading only the
+        files that changed since it was last asked for.
+        """
+        graph = project_graph(self.working_dir, self.source_dirs, self.main_paths)
+        graph.scan(self.elm_files())
+        return graph
+
+    def scanned_module_graph(self):
+        """
+        Return the import graph of the project's modules if it has been
+        scanned, or None, and bring it up to date in the background.
+        """
+        graph = project_graph(self.working_dir, self.source_dirs, self.main_paths)
+        graph.scan_in_background(self.elm_files)
+        return graph if graph.scanned else None
+
+    @property
+    def main_paths(self):
+        return [fs.normpath(fs.join(self.working_dir, self[MAIN_KEY]))] if self[MAIN_KEY] else []
+
     @property
     def main_path(self):
         return self[MAIN_KEY] or fs.relpath(self.file_path, self.working_dir)
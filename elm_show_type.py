@@ -2,19 +2,35 @@ from __future__ import print_function
 
 import webbrowser
 import os, os.path
-import subprocess
 import json
 import re
-from difflib import SequenceMatcher
+from collections import OrderedDict
 
 import sublime, sublime_plugin
 
 try:     # ST3
+    from .elm_plugin import RUNNER, STRINGS, count, get_setting, syntax_path, timed
+    from .elm_oracle import BackgroundLoader, DiskCache, dependencies_key, project_oracle, read_entries, read_imports
     from .elm_project import ElmProject
 except:  # ST2
+    from elm_plugin import RUNNER, STRINGS, count, get_setting, syntax_path, timed
+    from elm_oracle import BackgroundLoader, DiskCache, dependencies_key, project_oracle, read_entries, read_imports
     from elm_project import ElmProject
 
 LOOKUPS = {}
+DISK_CACHE = None
+# view id -> (change count, region of the word last resolved under the cursor)
+WORDS = {}
+# view id -> (change count, cursor point) of the latest selection change
+SELECTIONS = {}
+SELECTION_DELAY = 75
+# (full name, href) -> rendered panel text, least recently used first
+RENDERED = OrderedDict()
+RENDERED_LIMIT = 256
+# panel id -> (full name, href) of the symbol the panel shows
+PANEL_SYMBOLS = {}
+CODE_BLOCK_RE = re.compile('\n( {4}[\s\S]+?)((?=\n\S)\n|\Z)')
+CODE_INDENT_RE = re.compile('\n {4}')
 
 def join_qualified(region, view):
     """
@@ -25,42 +41,44 @@ def join_qualified(region, view):
     'Dict.map' word, this function will return the entire region encompassing
     'Dict.map'. The same is true if the region is encompassing 'Dict'.
 
-    Recursively expands outward in both directions, correctly returning longer
+    Repeatedly expands outward in both directions, correctly returning longer
     constructions such as 'Graphics.Input.button'
     """
-    starting_region = region
-    prefix = view.substr(region.a - 1)
-    suffix = view.substr(region.b)
-    if prefix == '.':
-        region = region.cover(view.word(region.a - 2))
-    if suffix == '.':
-        region = region.cover(view.word(region.b + 1))
-
-    if region == starting_region:
-        return region
-    else:
-        return join_qualified(region, view)
+    while True:
+        starting_region = region
+        if view.substr(region.a - 1) == '.':
+            region = region.cover(view.word(region.a - 2))
+        if view.substr(region.b) == '.':
+            region = region.cover(view.word(region.b + 1))
+        if region == starting_region:
+            return region
 
 def get_word_under_cursor(view):
     sel = view.sel()[0]
     region = join_qualified(view.word(sel), view)
     return view.substr(region).strip()     
 
-def get_type(view, panel):
+def has_types(scope):
+    return scope.find('source.elm') != -1 and scope.find('string') == -1 and scope.find('comment') == -1
+
+def get_type(view, panel, query=None):
     """
     Given a view, return the type signature of the word under the cursor,
-    if found. If no type is found, return an empty string. Write the info
-    to an output panel.
+    or of `query` if the caller has already resolved it, if found. If no
+    type is found, return an empty string. Write the info to an output panel.
     """
-    sel = view.sel()[0]
-    region = join_qualified(view.word(sel), view)
-    scope = view.scope_name(region.b)
-    if scope.find('source.elm') != -1 and scope.find('string') == -1 and scope.find('comment') == -1:
-        filename = view.file_name()
-        word = view.substr(region).strip()
-        sublime.set_timeout_async(lambda: search_and_set_status_message(filename, word, panel, 0), 0)
-
-def search_and_set_status_message(filename, query, panel, tries):
+    if query is None:
+        sel = view.sel()[0]
+        region = join_qualified(view.word(sel), view)
+        if not has_types(view.scope_name(region.b)):
+            return
+        query = view.substr(region)
+    filename = view.file_name()
+    word = query.strip()
+    if word:
+        sublime.set_timeout_async(lambda: search_and_set_status_message(filename, word, panel), 0)
+
+def search_and_set_status_message(filename, query, panel, waited=False):
     """
     Given a filename and a query, look up in the in-memory dict of values
     pulled from elm oracle to find a match. If a match is found, display
@@ -70,69 +88,86 @@ def search_and_set_status_message(filename, query, panel, tries):
     if len(query) == 0:
         return None
     if filename not in LOOKUPS.keys():
-        if tries >= 10:
-            return None
-        else:
-            # if the filename is not found loaded into memory, it's probably being
-            # loaded into memory right now. Try 10 more times at 100ms intervals
-            # and if it still isn't loaded, there's likely a problem we can't fix
-            # here.
-            sublime.set_timeout_async(search_and_set_status_message(filename, query, panel, tries + 1), 100)
+        if not waited:
+            # if the file is being loaded into memory right now, answer once
+            # the load has finished; only the latest query per panel is kept
+            retry = lambda: search_and_set_status_message(filename, query, panel, True)
+            LOADER.when_loaded(filename, lambda: sublime.set_timeout_async(retry, 0), key=panel.id())
     else:
-        data = LOOKUPS[filename]
-        if len(data) > 0:
-            matches = [item for item in data if item['name'] == query.split('.')[-1]]
-            if len(matches) == 0:
-                return None
+        with timed('oracle.lookup'):
+            item = LOOKUPS[filename].lookup(query)
+        if item is not None:
+            sublime.status_message(item['fullName'] + ' : ' + item['signature'])
+            symbol = (item['fullName'], item.get('href'))
+            if PANEL_SYMBOLS.get(panel.id()) != symbol:
+                PANEL_SYMBOLS[panel.id()] = symbol
+                with timed('show_type.render'):
+                    panel.run_command('erase_view')
+                    panel.run_command('append', {'characters': render_panel(item, symbol)})
             else:
-                # sort matches by similarity to query
-                matches.sort(key=lambda x: SequenceMatcher(None, query, x['fullName']).ratio(), reverse=True)
-                item = matches[0]
-                type_signature = item['fullName'] + ' : ' + item['signature']
-                sublime.status_message(type_signature)
-                panel.run_command('erase_view')
-                # add full name and type annotation
-                panel_output = '`' + type_signature + '`' + '\n\n' + item['comment'][1:]
-                # replace backticks with no-width space for syntax highlighting
-                panel_output = panel_output.replace('`', '\uFEFF')
-                # add no-width space to beginning and end of code blocks for syntax highlighting
-                panel_output = re.sub('\n( {4}[\s\S]+?)((?=\n\S)\n|\Z)', '\uFEFF\n\\1\uFEFF\n', panel_output)
-                # remove first four spaces on each line from code blocks
-                panel_output = re.sub('\n {4}', '\n', panel_output)
-                panel.run_command('append', {'characters': panel_output})
+                count('show_type.panel.unchanged')
         return None    
 
+def render_panel(item, symbol):
+    """
+    Return the type panel text for an oracle entry, reusing the text
+    rendered the last time the same symbol was shown.
+    """
+    if symbol in RENDERED:
+        count('show_type.render_cache.hit')
+        panel_output = RENDERED.pop(symbol)
+    else:
+        count('show_type.render_cache.miss')
+        type_signature = item['fullName'] + ' : ' + item['signature']
+        # add full name and type annotation
+        panel_output = '`' + type_signature + '`' + '\n\n' + item['comment'][1:]
+        # replace backticks with no-width space for syntax highlighting
+        panel_output = panel_output.replace('`', '\uFEFF')
+        # add no-width space to beginning and end of code blocks for syntax highlighting
+        panel_output = CODE_BLOCK_RE.sub('\uFEFF\n\\1\uFEFF\n', panel_output)
+        # remove first four spaces on each line from code blocks
+        panel_output = CODE_INDENT_RE.sub('\n', panel_output)
+        if len(RENDERED) >= RENDERED_LIMIT:
+            RENDERED.popitem(last=False)
+    RENDERED[symbol] = panel_output
+    return panel_output
+
 def get_matching_names(filename, prefix):
     """
     Given a file name and a search prefix, return a list of matching
     completions from elm oracle.
     """
+    # Sublime Text seems to have odd behavior on completions. If the full
+    # name is at the same "path level" as the prefix, then the completion
+    # will replace the entire entry, otherwise it will only replace after
+    # the final period separator
+    prefix_path = prefix.split('.')[:-1]
+    # get the characters to remove from the completion to avoid duplication
+    # of paths. If it's 0, then stay at 0, otherwise add a period back
+    chars_to_skip = len('.'.join(prefix_path))
+    if chars_to_skip > 0:
+        chars_to_skip += 1
+
     def skip_chars(full_name):
-        # Sublime Text seems to have odd behavior on completions. If the full
-        # name is at the same "path level" as the prefix, then the completion
-        # will replace the entire entry, otherwise it will only replace after
-        # the final period separator
-        full_name_path = full_name.split('.')[:-1]
-        prefix_path = prefix.split('.')[:-1]
-        if full_name_path == prefix_path:
+        if full_name.split('.')[:-1] == prefix_path:
             return full_name
         else:
-            # get the characters to remove from the completion to avoid duplication
-            # of paths. If it's 0, then stay at 0, otherwise add a period back
-            chars_to_skip = len('.'.join(prefix_path))
-            if chars_to_skip > 0:
-                chars_to_skip += 1
             return full_name[chars_to_skip:]
 
     global LOOKUPS
     if filename not in LOOKUPS.keys():
         return None
     else:
-        data = LOOKUPS[filename]
-        completions = {(v['fullName'] + '\t' + v['signature'], skip_chars(v['fullName'])) 
-            for v in data 
-            if v['fullName'].startswith(prefix) or v['name'].startswith(prefix)}
-        return [[v[0], v[1]] for v in completions]
+        completions = []
+        seen = set()
+        with timed('oracle.complete'):
+            matches = LOOKUPS[filename].complete(prefix)
+        for v in matches:
+            completion = [v['fullName'] + '\t' + v['signature'], skip_chars(v['fullName'])]
+            if completion[0] not in seen:
+                seen.add(completion[0])
+                completions.append(completion)
+        return completions
 
 def explore_package(filename, package_name):
     global LOOKUPS
@@ -148,8 +183,7 @@ def explore_package(filename, package_name):
             else:
                 open_in_browser(items[i][3])
         data = [[v['fullName'], v['signature'], v['comment'], v['href']] 
-            for v in LOOKUPS[filename] 
-            if v['fullName'].startswith(package_name)]
+            for v in LOOKUPS[filename].in_module(package_name)]
         # all items must be the same number of rows
         n = 75
         panel_items = [v[:2] + [v[2][:n]] + [v[2][n:2*n]] + [v[2][2*n:]] for v in data]
@@ -158,56 +192,110 @@ def explore_package(filename, package_name):
 def open_in_browser(url):
     webbrowser.open_new_tab(url)        
 
-def load_from_oracle(filename):
+def get_disk_cache():
+    """
+    Return the on-disk oracle cache, or None if it is turned off.
+    """
+    global DISK_CACHE
+    max_size = get_setting('elm_oracle_cache_size', 50) * 1024 * 1024
+    if max_size <= 0:
+        return None
+    if DISK_CACHE is None:
+        DISK_CACHE = DiskCache(os.path.join(sublime.cache_path(), 'Elm Language Support', 'oracle'), max_size)
+    DISK_CACHE.max_size = max_size
+    return DISK_CACHE
+
+def load_from_cache(filename):
+    """
+    Loads the data about a file from memory or the disk cache into the
+    LOOKUPS global dictionary, if it is there. Returns whether it was.
     """
-    Loads all data about the current file from elm oracle and adds it
-    to the LOOKUPS global dictionary.
+    global LOOKUPS
+    project = ElmProject(filename)
+    dependencies = dependencies_key(project.working_dir)
+    oracle = project_oracle(project.working_dir, dependencies)
+    imports = read_imports(filename)
+    index = oracle.reuse(imports)
+    count('oracle.memory_cache.' + ('miss' if index is None else 'hit'))
+    if index is None and imports is not None and get_disk_cache():
+        with timed('oracle.disk_cache.read'):
+            data = get_disk_cache().get(DiskCache.key(dependencies, imports))
+        count('oracle.disk_cache.' + ('miss' if data is None else 'hit'))
+        if data is not None:
+            index = oracle.add(imports, data)
+    if index is not None:
+        LOOKUPS[filename] = index
+    return index is not None
+
+def load_from_oracle(filename, task=None):
+    """
+    Loads all data about the current file and adds it to the LOOKUPS
+    global dictionary. The data is read straight from the documentation of
+    the installed dependencies, and elm oracle only runs when they aren't
+    installed. Files sharing a project share one index of the loaded
+    entries, and nothing is read again unless the project dependencies have
+    changed, or elm oracle is needed for modules no file has imported yet
+    and nothing for them is in the disk cache.
+    A cancelled task kills the elm oracle process and drops its output.
     """
     global LOOKUPS
+    if load_from_cache(filename):
+        return
     project = ElmProject(filename)
-    os.chdir(project.working_dir)
-
-    # Hide the console window on Windows
-    shell = False
-    path_separator = ':'
-    if os.name == "nt":
-        shell = True
-        path_separator = ';'
-
-    settings = sublime.load_settings('Elm Language Support.sublime-settings')
-    path = settings.get('elm_paths', '')
-    if path:
-        old_path = os.environ['PATH']
-        os.environ["PATH"] = os.path.expandvars(path + path_separator + '$PATH')
-
-    p = subprocess.Popen(['elm-oracle', filename, ''], stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE, shell=shell)
-
-    if path:
-        os.environ['PATH'] = old_path
-
-    output, errors = p.communicate()
-    output = output.strip()
-    if settings.get('debug', False):
-        string_settings = sublime.load_settings('Elm User Strings.sublime-settings')
-        print(string_settings.get('logging.prefix', '') + '(elm-oracle) ' + str(output), '\nerrors: ' + str(errors.strip()))
+    dependencies = dependencies_key(project.working_dir)
+    oracle = project_oracle(project.working_dir, dependencies)
+    imports = read_imports(filename)
+    disk_cache = get_disk_cache() if imports is not None else None
+    data = None
+    if imports is not None:
+        # every installed module at once, so no other file needs a read
+        with timed('oracle.read_docs'):
+            data = read_entries(project.working_dir)
+    if data is not None:
+        LOOKUPS[filename] = oracle.add(imports, data, all_modules=True)
+        return
+    data = run_oracle(filename, project, task)
+    if data is None:
+        return None
+    if disk_cache:
+        disk_cache.put(DiskCache.key(dependencies, imports), data)
+    LOOKUPS[filename] = oracle.add(imports, data)
+
+def run_oracle(filename, project, task=None):
+    """
+    Returns the output of elm oracle for a file, or None if it failed or
+    the task was cancelled.
+    """
+    with timed('oracle.spawn'):
+        result = RUNNER.run(['elm-oracle', filename, ''], cwd=project.working_dir, task=task)
+    if task is not None and task.cancelled:
+        count('oracle.cancelled')
+        return None
+    output, errors = result.output.strip(), result.errors
+    if get_setting('debug', False):
+        print(STRINGS.get('logging.prefix', '') + '(elm-oracle) ' + str(output), '\nerrors: ' + str(errors.strip()))
         if str(errors.strip()):
-            print('Your PATH is: ', os.environ['PATH'])
+            print('Your PATH is: ', RUNNER.search_path())
     try:
-        data = json.loads(output.decode('utf-8'))
+        with timed('oracle.parse'):
+            return json.loads(output.decode('utf-8'))
     except ValueError:
         return None
-    LOOKUPS[filename] = data
 
-def view_load(view):
+LOADER = BackgroundLoader(load_from_oracle)
+
+def view_load(view, saved=False):
     """
-    Selectively calls load_from_oracle based on the current scope.
+    Selectively loads oracle data based on the current scope. Data already
+    in a cache is loaded straight away, anything else is queued for the
+    background loader. Only a save makes a load that is running stale.
     """
     sel = view.sel()[0]
     region = join_qualified(view.word(sel), view)
     scope = view.scope_name(region.b)
-    if scope.find('source.elm') != -1:
-        load_from_oracle(view.file_name())
+    filename = view.file_name()
+    if scope.find('source.elm') != -1 and not load_from_cache(filename):
+        LOADER.request(filename, ElmProject(filename).working_dir, stale=saved)
 
 
 class ElmOracleListener(sublime_plugin.EventListener):
@@ -216,17 +304,36 @@ class ElmOracleListener(sublime_plugin.EventListener):
     """
 
     def on_selection_modified_async(self, view):
-        sel = view.sel()[0]
-        region = join_qualified(view.word(sel), view)
-        scope = view.scope_name(region.b)
-        if scope.find('source.elm') != -1:
-            view.run_command('elm_show_type')
+        # only look up a single cursor that has left the last word looked up,
+        # and only once it has stopped moving for a moment
+        sel = view.sel()
+        if len(sel) != 1:
+            return
+        change_count = view.change_count()
+        point = sel[0].b
+        last_word = WORDS.get(view.id())
+        if last_word and last_word[0] == change_count and last_word[1].contains(point):
+            return
+        selection = SELECTIONS[view.id()] = (change_count, point)
+        sublime.set_timeout_async(lambda: self.show_type(view, selection), SELECTION_DELAY)
+
+    def show_type(self, view, selection):
+        if SELECTIONS.get(view.id()) != selection or view.change_count() != selection[0]:
+            return
+        region = join_qualified(view.word(selection[1]), view)
+        WORDS[view.id()] = (selection[0], region)
+        if has_types(view.scope_name(region.b)):
+            view.run_command('elm_show_type', {'query': view.substr(region)})
+
+    def on_close(self, view):
+        WORDS.pop(view.id(), None)
+        SELECTIONS.pop(view.id(), None)
 
     def on_activated_async(self, view):
         view_load(view)
 
     def on_post_save_async(self, view):
-        view_load(view)
+        view_load(view, saved=True)
 
     def on_query_completions(self, view, prefix, locations):
         word = get_word_under_cursor(view)
@@ -240,15 +347,16 @@ class ElmShowType(sublime_plugin.TextCommand):
     """
     type_panel = None
 
-    def run(self, edit, panel=False):
+    def run(self, edit, panel=False, query=None):
         if self.type_panel is None:
             self.type_panel = self.view.window().create_output_panel('elm_type')
             if os.name == "nt":
                 # using extension hide-tmLanguage because hidden-tmLanguage doesn't work correctly
-                self.type_panel.set_syntax_file('Packages/Elm Language Support/Syntaxes/Elm Documentation.hide-tmLanguage')
+                syntax = 'Packages/Elm Language Support/Syntaxes/Elm Documentation.hide-tmLanguage'
             else:
-                self.type_panel.set_syntax_file('Packages/Elm Language Support/Syntaxes/Elm Documentation.hidden-tmLanguage')
-        get_type(self.view, self.type_panel)
+                syntax = 'Packages/Elm Language Support/Syntaxes/Elm Documentation.hidden-tmLanguage'
+            self.type_panel.set_syntax_file(syntax_path(syntax))
+        get_type(self.view, self.type_panel, query)
         if panel:
             self.view.window().run_command('elm_show_type_panel')
 
@@ -0,0 +1,40 @@
+try:     # ST3
+    from .elm_plugin import *
+except:  # ST2
+    from elm_plugin import *
+
+ELM_SYNTAX = SYNTAXES_DIR + 'Elm.tmLanguage'
+
+class ElmSyntaxListener(sublime_plugin.EventListener):
+    """
+    Switches Elm views to the hidden Elm.sublime-syntax on builds that
+    support it. Elm.tmLanguage stays the one syntax registered for .elm
+    files, and keeps being used when a GLSL grammar is installed, since
+    only it embeds GLSL in [glsl| ... |] blocks.
+    """
+
+    def on_load(self, view):
+        self.switch(view)
+
+    def on_activated(self, view):
+        self.switch(view)
+
+    def on_post_save(self, view):
+        self.switch(view)
+
+    def switch(self, view):
+        if view.settings().get('syntax') != ELM_SYNTAX:
+            return
+        syntax = syntax_path(ELM_SYNTAX)
+        if syntax != ELM_SYNTAX and not has_glsl_syntax():
+            view.set_syntax_file(syntax)
+
+glsl_installed = None
+
+def has_glsl_syntax():
+    # looked up once, installing a GLSL package takes a restart to notice
+    global glsl_installed
+    if glsl_installed is None:
+        resources = sublime.find_resources('*.tmLanguage') + sublime.find_resources('*.sublime-syntax')
+        glsl_installed = any('glsl' in fs.basename(path).lower() for path in resources)
+    return glsl_installed
@@ -0,0 +1,47 @@
+import json
+
+try:     # ST3
+    from .elm_plugin import *
+except:  # ST2
+    from elm_plugin import *
+
+class ElmTimingCommand(sublime_plugin.WindowCommand):
+    """
+    Shows the latencies and counters recorded by the plugin in an output
+    panel, or writes them as JSON to `path` for comparing runs offline.
+    """
+
+    def run(self, path=None, reset=False):
+        summary = STATS.summary()
+        if reset:
+            STATS.reset()
+        if path:
+            with open(fs.expanduser(path), 'w') as json_file:
+                json.dump(summary, json_file, indent=4, sort_keys=True)
+            sublime.status_message(get_string('timing.saved', path))
+            return
+        panel = self.window.create_output_panel('elm_timing')
+        panel.run_command('erase_view')
+        panel.run_command('append', {'characters': format_summary(summary)})
+        self.window.run_command('show_panel', {'panel': 'output.elm_timing'})
+
+class ElmTimingSaveCommand(sublime_plugin.WindowCommand):
+
+    def run(self):
+        self.window.show_input_panel(get_string('timing.path_caption'), 'elm-timing.json',
+            lambda path: self.window.run_command('elm_timing', {'path': path}), None, None)
+
+def format_summary(summary):
+    bounds = ['<=' + str(bound) for bound in Stats.BUCKETS] + ['>' + str(Stats.BUCKETS[-1])]
+    header = '{0:<32}{1:>7}{2:>9}{3:>9}{4:>9}{5:>9}{6:>9}   {7}'.format(
+        'operation (ms)', 'count', 'mean', 'p50', 'p90', 'p99', 'max', ' '.join(bounds))
+    lines = [header]
+    for name, timing in sorted(summary['timings'].items()):
+        histogram = ' '.join('{0:>{1}}'.format(n, len(bound)) for n, bound in zip(timing['histogram'], bounds))
+        lines.append('{0:<32}{count:>7}{mean:>9.1f}{p50:>9.1f}{p90:>9.1f}{p99:>9.1f}{max:>9.1f}   {1}'.format(
+            name, histogram, **timing))
+    lines.append('')
+    lines.append('{0:<32}{1:>7}'.format('counter', 'count'))
+    for name, value in sorted(summary['counters'].items()):
+        lines.append('{0:<32}{1:>7}'.format(name, value))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,198 @@
+"""
+Converts the package's YAML-tmLanguage grammars to .sublime-syntax files.
+With --check, checks instead that the files are current and tokenize the
+benchmark corpora with the same scopes as the grammars, which needs bench/.
+
+A begin/end rule becomes a match that pushes an anonymous context: its name
+becomes the context's meta_scope, its contentName the meta_content_scope,
+and its end pattern a pop match, listed first unless applyEndPatternLast is
+set. Repository entries become named contexts. Includes of grammars that
+aren't converted here and don't ship with Sublime are dropped, since a
+.sublime-syntax fails to load when an included scope is missing.
+
+Usage: python tools/sublime_syntax.py [--check] [--out DIR]
+"""
+import argparse
+import io
+import os.path as fs
+import re
+import sys
+
+import yaml
+
+HERE = fs.dirname(fs.abspath(__file__))
+SYNTAXES = fs.join(fs.dirname(HERE), 'Syntaxes')
+BENCH = fs.join(fs.dirname(HERE), 'bench')
+
+NAMES = ('Elm', 'Elm Documentation', 'Elm Compile Messages')
+KNOWN_SCOPES = ('source.elm', 'text.html.mediawiki.elm-documentation', 'text.html.mediawiki.elm-build-output',
+    'source.elm.modules')
+
+
+def convert(data):
+    """
+    Return the .sublime-syntax form of a parsed YAML-tmLanguage grammar as a
+    dict of header fields and a dict of contexts.
+    """
+    # the .tmLanguage keeps claiming the file extensions, so there is one
+    # Elm in the syntax menu, and elm_syntax.py switches views over
+    header = [('name', data['name']), ('scope', data['scopeName']), ('hidden', True)]
+    contexts = [('main', convert_patterns(data.get('patterns', [])))]
+    for key, rule in (data.get('repository') or {}).items():
+        if 'match' in rule or 'begin' in rule:
+            contexts.append((key, [convert_rule(rule)]))
+        else:
+            contexts.append((key, convert_patterns(rule.get('patterns', []))))
+    return header, contexts
+
+def convert_patterns(patterns):
+    items = []
+    for rule in patterns:
+        if 'include' in rule:
+            include = convert_include(rule['include'])
+            if include:
+                items.append({'include': include})
+        elif 'match' in rule or 'begin' in rule:
+            items.append(convert_rule(rule))
+        else:
+            items.extend(convert_patterns(rule.get('patterns', [])))
+    return items
+
+def convert_include(include):
+    if include == '$self':
+        return 'main'
+    if include.startswith('#'):
+        return include[1:]
+    if include in KNOWN_SCOPES:
+        return 'scope:' + include
+    return None
+
+def convert_captures(captures, item):
+    names = dict((int(key), capture['name']) for key, capture in captures.items() if capture.get('name'))
+    if 0 in names:
+        item['scope'] = item['scope'] + ' ' + names.pop(0) if 'scope' in item else names.pop(0)
+    if names:
+        item['captures'] = dict(sorted(names.items()))
+
+def convert_rule(rule):
+    item = {}
+    comment = rule.get('comment')
+    if isinstance(comment, list):
+        # an unquoted `[Finished in 4.2s]` reads as a list
+        comment = '[' + ', '.join(str(value) for value in comment) + ']'
+    if comment:
+        item['comment'] = comment
+    if 'match' in rule:
+        item['match'] = rule['match']
+        if rule.get('name'):
+            item['scope'] = rule['name']
+        convert_captures(rule.get('captures', {}), item)
+        return item
+    item['match'] = rule['begin']
+    convert_captures(rule.get('beginCaptures', rule.get('captures', {})), item)
+    context = []
+    if rule.get('name'):
+        context.append({'meta_scope': rule['name']})
+    if rule.get('contentName'):
+        context.append({'meta_content_scope': rule['contentName']})
+    end = {'match': rule['end']}
+    convert_captures(rule.get('endCaptures', rule.get('captures', {})), end)
+    end['pop'] = True
+    patterns = convert_patterns(rule.get('patterns', []))
+    context.extend(patterns + [end] if rule.get('applyEndPatternLast') else [end] + patterns)
+    item['push'] = context
+    return item
+
+
+KEY_ORDER = ('meta_scope', 'meta_content_scope', 'include', 'match', 'scope', 'captures', 'push', 'pop')
+
+def dump(header, contexts, source_name):
+    lines = [
+        '%YAML 1.2',
+        '---',
+        '# Generated from {0} by tools/sublime_syntax.py, edit that file instead.'.format(source_name),
+    ]
+    for key, value in header:
+        lines.append('{0}: {1}'.format(key, scalar(value, '', plain=True)))
+    lines.append('')
+    lines.append('contexts:')
+    for name, items in contexts:
+        lines.append('  {0}:'.format(name))
+        dump_items(items, '    ', lines)
+        lines.append('')
+    return '\n'.join(lines[:-1]) + '\n'
+
+def dump_items(items, indent, lines):
+    for item in items:
+        for comment_line in item.get('comment', '').splitlines():
+            lines.append(indent + '# ' + comment_line)
+        prefix = indent + '- '
+        for key in KEY_ORDER:
+            if key not in item:
+                continue
+            value = item[key]
+            if key == 'captures':
+                lines.append(prefix + 'captures:')
+                for group, scope in sorted(value.items()):
+                    lines.append(indent + '    {0}: {1}'.format(group, scope))
+            elif key == 'push':
+                lines.append(prefix + 'push:')
+                dump_items(value, indent + '    ', lines)
+            else:
+                lines.append(prefix + '{0}: {1}'.format(key, scalar(value, indent + '    ', key != 'match')))
+            prefix = indent + '  '
+
+PLAIN_RE = re.compile(r'^[A-Za-z][\w.\-]*( [A-Za-z][\w.\-]*)*$')
+
+def scalar(value, indent, plain=False):
+    if value is True:
+        return 'true'
+    if '\n' in value:
+        return '|-\n' + '\n'.join(indent + line if line else '' for line in value.split('\n'))
+    if plain and PLAIN_RE.match(value) and value.lower() not in ('true', 'false', 'null', 'yes', 'no', 'on', 'off'):
+        return value
+    return "'" + value.replace("'", "''") + "'"
+
+
+def check(generated):
+    failures = []
+    for path, text in generated:
+        try:
+            with io.open(path, encoding='utf-8') as syntax_file:
+                if syntax_file.read() != text:
+                    failures.append('{0} is out of date'.format(fs.basename(path)))
+        except IOError:
+            failures.append('{0} is missing'.format(fs.basename(path)))
+    # the tokenizers and corpora live with the grammar benchmark
+    sys.path.insert(0, BENCH)
+    import syntax_check
+    return failures + syntax_check.check([path for path, text in generated])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--out', default=SYNTAXES)
+    parser.add_argument('--check', action='store_true',
+        help="don't write anything, check the files in --out are current and scope-equivalent")
+    args = parser.parse_args()
+
+    generated = []
+    for name in NAMES:
+        source_name = name + '.YAML-tmLanguage'
+        with io.open(fs.join(SYNTAXES, source_name), encoding='utf-8') as grammar_file:
+            data = yaml.safe_load(grammar_file)
+        header, contexts = convert(data)
+        generated.append((fs.join(args.out, name + '.sublime-syntax'), dump(header, contexts, source_name)))
+
+    if args.check:
+        failures = check(generated)
+        if failures:
+            print('check failed:\n  ' + '\n  '.join(failures))
+            sys.exit(1)
+        return
+    for path, text in generated:
+        with io.open(path, 'w', encoding='utf-8', newline='\n') as syntax_file:
+            syntax_file.write(text)
+        print('wrote ' + path)
+
+if __name__ == '__main__':
+    main()